@@ -5,7 +5,7 @@ from aiogram.types import BotCommand
 
 from .config import settings
 from .db import ensure_db
-from .subscription import SubscriptionMiddleware
+from .subscription import SubscriptionMiddleware, on_channel_member
 from .handlers import (
     # Основной поток
     cmd_start, on_main, on_back, on_news,
@@ -62,6 +62,8 @@ def build_bot_dp():
     
 
     dp.callback_query.register(on_check_subscription, F.data == "check_sub")
+    # статусы подписчиков канала (приходят, если бот — администратор канала)
+    dp.chat_member.register(on_channel_member)
     dp.callback_query.register(on_pick_date, F.data.startswith("d:"))
     dp.callback_query.register(on_pick_grade, F.data.startswith("g:"))
     dp.callback_query.register(on_pick_label, F.data.startswith("c:"))
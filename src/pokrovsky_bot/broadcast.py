@@ -0,0 +1,151 @@
+import asyncio
+import time
+from typing import Any, Dict, List, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+
+from .config import settings
+from .db import outbox_add, outbox_count, outbox_done, outbox_pending
+
+# Рассылка идёт из таблицы outbox отдельной фоновой задачей (main.py):
+# уведомления только ставятся в очередь, наблюдатель не ждёт отправки.
+
+# Сводка для /admin
+STATS: Dict[str, Any] = {
+    "queued": 0,
+    "sent": 0,
+    "failed": 0,
+    "retry_after": 0,
+    "retries": 0,
+    "last_batch": 0,
+    "last_duration": 0.0,
+}
+
+_WAKE = asyncio.Event()
+
+
+class TokenBucket:
+    """Ведро токенов: rate в секунду, запас burst. pause() — общая пауза по RetryAfter."""
+
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._ts = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float) -> None:
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.burst, self._tokens + (now - self._ts) * self.rate)
+                self._ts = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class ChatLimiter:
+    """Не чаще одного сообщения в чат за interval секунд."""
+
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+        self._next: Dict[int, float] = {}
+
+    async def acquire(self, chat_id: int) -> None:
+        now = time.monotonic()
+        at = max(self._next.get(chat_id, 0.0), now)
+        self._next[chat_id] = at + self.interval
+        if at > now:
+            await asyncio.sleep(at - now)
+
+    def forget_idle(self) -> None:
+        now = time.monotonic()
+        for k in [k for k, t in self._next.items() if t < now]:
+            del self._next[k]
+
+
+async def enqueue(items: List[Tuple[int, str, str, str]]) -> None:
+    """items: [(user_id, html, event, meta)]. Отправит broadcast_loop."""
+    if not items:
+        return
+    await outbox_add(items)
+    STATS["queued"] += len(items)
+    _WAKE.set()
+
+
+async def _send_batch(bot: Bot, rows: List[tuple], bucket: TokenBucket, chats: ChatLimiter) -> None:
+    queue: "asyncio.Queue[list]" = asyncio.Queue()
+    for row in rows:
+        queue.put_nowait(list(row))
+    sent: List[Tuple[int, int, str, str]] = []
+    failed: List[Tuple[int, int, str, str, int, str]] = []
+
+    async def worker():
+        while True:
+            try:
+                row = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            oid, uid, text, event, meta, attempts = row
+            await chats.acquire(uid)
+            await bucket.acquire()
+            try:
+                await bot.send_message(uid, text, parse_mode="HTML", disable_web_page_preview=True)
+                sent.append((oid, uid, event, meta))
+            except TelegramRetryAfter as e:
+                # флуд-контроль: притормаживаем всех и повторяем это же сообщение
+                STATS["retry_after"] += 1
+                bucket.pause(e.retry_after)
+                queue.put_nowait(row)
+            except (TelegramForbiddenError, TelegramBadRequest) as e:
+                # бот заблокирован / чат не найден — повтор не поможет
+                failed.append((oid, uid, event, meta, attempts + 1, str(e)))
+            except Exception as e:
+                row[5] = attempts + 1
+                if row[5] >= settings.BROADCAST_RETRIES:
+                    failed.append((oid, uid, event, meta, row[5], str(e)))
+                else:
+                    STATS["retries"] += 1
+                    await asyncio.sleep(2 ** attempts)
+                    queue.put_nowait(row)
+
+    await asyncio.gather(*(worker() for _ in range(max(1, settings.BROADCAST_WORKERS))))
+    await outbox_done(sent, failed)
+    STATS["sent"] += len(sent)
+    STATS["failed"] += len(failed)
+
+
+async def broadcast_loop(bot: Bot) -> None:
+    """Отправка очереди outbox. При старте дошлёт то, что не успели до перезапуска."""
+    rate = max(settings.BROADCAST_RATE, 0.1)
+    bucket = TokenBucket(rate, burst=rate)
+    chats = ChatLimiter(settings.BROADCAST_CHAT_INTERVAL)
+    STATS["queued"] = await outbox_count()
+    while True:
+        _WAKE.clear()
+        rows = await outbox_pending(settings.BROADCAST_BATCH)
+        if not rows:
+            STATS["queued"] = 0
+            await _WAKE.wait()
+            continue
+        t0 = time.monotonic()
+        try:
+            await _send_batch(bot, rows, bucket, chats)
+        except Exception as e:
+            print(f"[broadcast] {e}")
+            await asyncio.sleep(5)
+        chats.forget_idle()
+        STATS["queued"] = await outbox_count()
+        STATS["last_batch"] = len(rows)
+        STATS["last_duration"] = time.monotonic() - t0
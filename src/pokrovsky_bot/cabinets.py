@@ -0,0 +1,98 @@
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .cache import approx_sizeof
+from .models import CabIndex, SheetData
+from .parser import extract_schedule_anycab
+from .state import CAB_INDEX
+
+# Расписание по кабинетам: CAB_INDEX[date] -> CabIndex. Строится один раз из всех вкладок даты,
+# дальше наблюдатель зовёт update_tab() для изменившейся вкладки — полной пересборки нет.
+
+Entry = Tuple[str, str, Optional[str]]  # (time, klass, subj)
+
+
+def is_physical_cab(cab: Optional[str]) -> bool:
+    if not cab:
+        return False
+    u = cab.upper()
+    if any(x in u for x in ("ОНЛАЙН", "ОФЛАЙН", "ДИСТАНТ")):
+        return False
+    return True
+
+
+def time_sort_key(t: str) -> Tuple[int, int]:
+    s = (t or "").replace(".", ":")
+    m = re.search(r"(\d{1,2}):(\d{2})", s)
+    if not m:
+        return (99, 99)
+    return (int(m.group(1)), int(m.group(2)))
+
+
+def tab_cabinets(sheet: SheetData) -> Dict[str, List[Entry]]:
+    """Пары всех классов вкладки по кабинетам (кабинет ищем «в своей зоне»)."""
+    out: Dict[str, List[Entry]] = {}
+    rows, labels, headers, _cab_map = sheet
+    for klass in labels:
+        for t, subj, cab in extract_schedule_anycab(rows, labels, headers, klass):
+            if not is_physical_cab(cab):
+                continue
+            # делим "Г3-04/Г4-03" на отдельные кабинеты
+            for cab_one in re.split(r"[\/,;|]+", (cab or "").upper()):
+                key = cab_one.strip()
+                if key and is_physical_cab(key):
+                    out.setdefault(key, []).append((t, klass, subj))
+    return out
+
+
+def _merge(idx: CabIndex, cabs: Iterable[str]):
+    for cab in cabs:
+        lst = [e for _digest, part in idx.parts.values() for e in part.get(cab, ())]
+        if lst:
+            lst.sort(key=lambda x: time_sort_key(x[0]))
+            idx.cabs[cab] = lst
+        else:
+            idx.cabs.pop(cab, None)
+    idx.nbytes = approx_sizeof((idx.parts, idx.cabs))
+
+
+def build_index(sheets: Dict[str, SheetData]) -> CabIndex:
+    idx = CabIndex(parts={gid: (s.digest, tab_cabinets(s)) for gid, s in sheets.items()})
+    _merge(idx, {cab for _d, part in idx.parts.values() for cab in part})
+    return idx
+
+
+async def cabinet_index(date: str) -> Dict[str, List[Entry]]:
+    """{кабинет: пары} на дату; при промахе — все вкладки одной пачкой (ensure.load_all_sheets)."""
+    idx = CAB_INDEX.get(date)
+    if idx is not None:
+        return idx.cabs
+    from .ensure import load_all_sheets
+    try:
+        sheets = await load_all_sheets(date)
+    except Exception:
+        return {}
+    idx = build_index(sheets)
+    CAB_INDEX[date] = idx
+    return idx.cabs
+
+
+def is_stale(date: str, gid: str, digest: str) -> bool:
+    """Индекс даты построен, а вклад вкладки в нём от другой версии (или вкладки не было)."""
+    idx = CAB_INDEX.peek(date)
+    if idx is None:
+        return False
+    part = idx.parts.get(gid)
+    return part is None or part[0] != digest
+
+
+def update_tab(date: str, gid: str, sheet: SheetData):
+    """Новая версия вкладки: пересчитать её вклад и слить только затронутые кабинеты."""
+    idx = CAB_INDEX.peek(date)
+    if idx is None or not is_stale(date, gid, sheet.digest):
+        return
+    old = idx.parts.get(gid, ("", {}))[1]
+    new = tab_cabinets(sheet)
+    idx.parts[gid] = (sheet.digest, new)
+    _merge(idx, set(old) | set(new))
+    CAB_INDEX[date] = idx  # пересчёт размера записи в кэше
@@ -0,0 +1,171 @@
+import sys
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterator, List, Optional, Tuple
+
+# Все созданные кэши — для /admin
+CACHES: Dict[str, "LRUCache"] = {}
+
+_MISSING = object()
+
+
+def approx_sizeof(obj: Any, _seen: Optional[set] = None) -> int:
+    """Грубая оценка занимаемой памяти (байты) с обходом вложенных контейнеров."""
+    if _seen is None:
+        _seen = set()
+    oid = id(obj)
+    if oid in _seen:
+        return 0
+    _seen.add(oid)
+    nbytes = getattr(obj, "nbytes", None)
+    if isinstance(nbytes, int):
+        return nbytes
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            size += approx_sizeof(k, _seen) + approx_sizeof(v, _seen)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for v in obj:
+            size += approx_sizeof(v, _seen)
+    return size
+
+
+class LRUCache:
+    """
+    Кэш с бюджетом по памяти (LRU-вытеснение) и TTL на запись.
+    Повторяет нужную часть интерфейса dict, чтобы заменить им глобальные словари.
+    max_bytes=0 / ttl=0 — без ограничения.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_bytes: int = 0,
+        ttl: float = 0.0,
+        sizeof: Callable[[Any], int] = approx_sizeof,
+    ) -> None:
+        self.name = name
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._sizeof = sizeof
+        self._data: "OrderedDict[Hashable, Tuple[Any, int, float]]" = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        CACHES[name] = self
+
+    # --- внутреннее ---
+    def _alive(self, key: Hashable) -> Optional[Tuple[Any, int, float]]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[2] and entry[2] <= time.monotonic():
+            self._drop(key)
+            self.expirations += 1
+            return None
+        return entry
+
+    def _drop(self, key: Hashable) -> None:
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[1]
+
+    def _shrink(self) -> None:
+        if not self.max_bytes:
+            return
+        # самая свежая запись остаётся, даже если одна больше бюджета
+        while self.bytes > self.max_bytes and len(self._data) > 1:
+            key = next(iter(self._data))
+            self._drop(key)
+            self.evictions += 1
+
+    # --- интерфейс ---
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._alive(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self._data.move_to_end(key)
+        return entry[0]
+
+    def peek(self, key: Hashable, default: Any = None) -> Any:
+        """Как get, но без учёта в статистике и без продвижения в LRU."""
+        entry = self._alive(key)
+        return entry[0] if entry is not None else default
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        self._drop(key)
+        ttl = self.ttl if ttl is None else ttl
+        size = self._sizeof(value)
+        self._data[key] = (value, size, time.monotonic() + ttl if ttl else 0.0)
+        self.bytes += size
+        self._shrink()
+
+    def __getitem__(self, key: Hashable) -> Any:
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: Hashable, value: Any) -> None:
+        self.set(key, value)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self._alive(key) is not None
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __iter__(self) -> Iterator[Hashable]:
+        return iter(self.keys())
+
+    def keys(self) -> List[Hashable]:
+        return [k for k, _v in self.items()]
+
+    def items(self) -> List[Tuple[Hashable, Any]]:
+        now = time.monotonic()
+        return [(k, e[0]) for k, e in list(self._data.items()) if not e[2] or e[2] > now]
+
+    def values(self) -> List[Any]:
+        return [v for _k, v in self.items()]
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._alive(key)
+        self._drop(key)
+        return entry[0] if entry is not None else default
+
+    def invalidate(self, key: Hashable) -> bool:
+        if key in self._data:
+            self._drop(key)
+            self.invalidations += 1
+            return True
+        return False
+
+    def invalidate_where(self, pred: Callable[[Hashable], bool]) -> int:
+        keys = [k for k in self._data if pred(k)]
+        for k in keys:
+            self._drop(k)
+        self.invalidations += len(keys)
+        return len(keys)
+
+    def clear(self) -> None:
+        self.invalidations += len(self._data)
+        self._data.clear()
+        self.bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "entries": len(self._data),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
@@ -16,18 +16,75 @@ class Settings:
     BOT_TOKEN: str = os.getenv("BOT_TOKEN", "")
     ADMIN_ID: int = int(os.getenv("ADMIN_ID", "0"))
 
+    # Режим получения апдейтов: polling | webhook
+    RUN_MODE: str = os.getenv("RUN_MODE", "polling").strip().lower()
+    WEBHOOK_URL: str = os.getenv("WEBHOOK_URL", "").strip()  # публичный https-адрес; пусто — вебхук не регистрируем
+    WEBHOOK_PATH: str = os.getenv("WEBHOOK_PATH", "/tg/webhook")
+    WEBHOOK_SECRET: str = os.getenv("WEBHOOK_SECRET", "")  # X-Telegram-Bot-Api-Secret-Token
+    WEBHOOK_HOST: str = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+    WEBHOOK_PORT: int = int(os.getenv("WEBHOOK_PORT", "8080"))
+    # Несколько реплик: наблюдатель/рассылку ведёт держатель аренды в общей БД (сек до перехвата)
+    LEADER_LEASE_TTL: float = float(os.getenv("LEADER_LEASE_TTL", "30"))
+
     # Канал: username (@channel) ИЛИ числовой id (-100…)
     NEWS_CHANNEL_URL: str = os.getenv("NEWS_CHANNEL_URL", "https://t.me/YourNewsChannel")
     NEWS_CHANNEL_ID: str = os.getenv("NEWS_CHANNEL_ID", "").strip()  # <-- строка, без int()
+    # Кэш проверки подписки (сек): подписан / не подписан
+    SUB_CACHE_TTL: float = float(os.getenv("SUB_CACHE_TTL", "900"))
+    SUB_NEG_TTL: float = float(os.getenv("SUB_NEG_TTL", "20"))
 
     # Источник расписания и база
     PAGE_URL: str = os.getenv("PAGE_URL", "https://pokrovsky.gosuslugi.ru/glavnoe/raspisanie/")
     DB_PATH: str = os.getenv("DB_PATH") or str(PROJECT_ROOT / "data" / "bot.db")
+    # Отложенная запись кликов (users/events): размер пачки, период сброса (сек), размер очереди
+    DB_BATCH: int = int(os.getenv("DB_BATCH", "500"))
+    DB_FLUSH_INTERVAL: float = float(os.getenv("DB_FLUSH_INTERVAL", "0.5"))
+    DB_QUEUE_MAX: int = int(os.getenv("DB_QUEUE_MAX", "10000"))
+    DB_CACHE_MB: int = int(os.getenv("DB_CACHE_MB", "16"))  # страничный кэш SQLite на соединение
+    DB_MMAP_MB: int = int(os.getenv("DB_MMAP_MB", "128"))   # отображение файла БД в память
+    DB_READERS: int = int(os.getenv("DB_READERS", "4"))  # потоков/соединений для чтения
+    # Хранение сырых событий: дней (0 — бессрочно), архив по месяцам вместо удаления, пачка, период (сек)
+    EVENTS_KEEP_DAYS: int = int(os.getenv("EVENTS_KEEP_DAYS", "180"))
+    EVENTS_ARCHIVE: bool = os.getenv("EVENTS_ARCHIVE", "1") not in ("0", "false", "False", "")
+    RETENTION_BATCH: int = int(os.getenv("RETENTION_BATCH", "5000"))
+    RETENTION_INTERVAL: float = float(os.getenv("RETENTION_INTERVAL", "21600"))
+    LINKS_TTL: float = float(os.getenv("LINKS_TTL", "60"))  # сек, после — фоновое обновление списка дат
+
+    # Кэши (бюджет в МБ, TTL в секундах; 0 — без ограничения)
+    SHEET_CACHE_MB: int = int(os.getenv("SHEET_CACHE_MB", "64"))
+    SHEET_CACHE_TTL: float = float(os.getenv("SHEET_CACHE_TTL", "1800"))
+    CAB_CACHE_MB: int = int(os.getenv("CAB_CACHE_MB", "16"))
+    META_CACHE_TTL: float = float(os.getenv("META_CACHE_TTL", "21600"))
+
+    # Наблюдатель
+    WATCH_CONCURRENCY: int = int(os.getenv("WATCH_CONCURRENCY", "6"))  # одновременных загрузок
+    WATCH_PAST_DAYS: int = int(os.getenv("WATCH_PAST_DAYS", "3"))       # окно активных дат назад
+    WATCH_FUTURE_DAYS: int = int(os.getenv("WATCH_FUTURE_DAYS", "14"))  # и вперёд
+    # Интервалы адаптивного опроса (сек): сегодня/завтра, будущие, прошедшие даты, страница школы
+    WATCH_HOT_INTERVAL: float = float(os.getenv("WATCH_HOT_INTERVAL", "120"))
+    WATCH_WARM_INTERVAL: float = float(os.getenv("WATCH_WARM_INTERVAL", "600"))
+    WATCH_COLD_INTERVAL: float = float(os.getenv("WATCH_COLD_INTERVAL", "3600"))
+    WATCH_SITE_INTERVAL: float = float(os.getenv("WATCH_SITE_INTERVAL", "300"))
+    WATCH_MIN_INTERVAL: float = float(os.getenv("WATCH_MIN_INTERVAL", "60"))
+    WATCH_MAX_INTERVAL: float = float(os.getenv("WATCH_MAX_INTERVAL", "21600"))
+
+    # Рассылка уведомлений (лимиты Telegram: ~30 сообщений/с всего и ~1/с в один чат)
+    BROADCAST_RATE: float = float(os.getenv("BROADCAST_RATE", "25"))            # сообщений/с всего
+    BROADCAST_CHAT_INTERVAL: float = float(os.getenv("BROADCAST_CHAT_INTERVAL", "1"))  # сек между сообщениями в один чат
+    BROADCAST_WORKERS: int = int(os.getenv("BROADCAST_WORKERS", "8"))
+    BROADCAST_BATCH: int = int(os.getenv("BROADCAST_BATCH", "200"))            # строк очереди за проход
+    BROADCAST_RETRIES: int = int(os.getenv("BROADCAST_RETRIES", "3"))
 
     # Прочее
     TZ: str = os.getenv("TZ", "Europe/Moscow")
     USER_AGENT: str = os.getenv("USER_AGENT", "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36")
 
+    # HTTP-пул (общая сессия)
+    HTTP_LIMIT: int = int(os.getenv("HTTP_LIMIT", "100"))
+    HTTP_LIMIT_PER_HOST: int = int(os.getenv("HTTP_LIMIT_PER_HOST", "30"))
+    HTTP_KEEPALIVE: float = float(os.getenv("HTTP_KEEPALIVE", "60"))
+    HTTP_DNS_TTL: int = int(os.getenv("HTTP_DNS_TTL", "600"))
+
     # Донаты
     DONATE_CRYPTOBOT_URL: str = os.getenv("DONATE_CRYPTOBOT_URL", "")
     DONATE_HELEKET_URL: str = os.getenv("DONATE_HELEKET_URL", "")
@@ -1,50 +1,47 @@
+import asyncio
+import queue
 import sqlite3
-from typing import Optional, Tuple, Dict, List, Any
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
 from .config import settings
 from .utils import fmt_msk
 
+# Доступ к SQLite не блокирует цикл событий:
+#  - DB — единственное соединение-писатель, им пользуется только поток db-writer;
+#  - чтения идут в пуле потоков, у каждого своё соединение только для чтения (WAL: не ждут писателя).
+# Публичные функции — корутины с прежними именами; upsert_user/log_event только ставят запись в очередь.
+# log_event/log_events_many синхронные и никогда не ждут: при полной очереди событие отбрасывается.
 DB: Optional[sqlite3.Connection] = None
+_READERS: Optional[ThreadPoolExecutor] = None
+_LOCAL = threading.local()
 _NOARG = object()  # sentinel для отличия "не менять поле" от "установить None"
 
 
+def tune_connection(con: sqlite3.Connection, readonly: bool = False):
+    """PRAGMA на открытии соединения (действуют только в пределах соединения)."""
+    con.execute("PRAGMA busy_timeout=5000")
+    con.execute(f"PRAGMA cache_size=-{settings.DB_CACHE_MB * 1024}")  # отрицательное — в КиБ
+    con.execute(f"PRAGMA mmap_size={settings.DB_MMAP_MB * 1024 * 1024}")
+    con.execute("PRAGMA temp_store=MEMORY")
+    if not readonly:
+        # в режиме WAL NORMAL не теряет целостность, а fsync делается только на checkpoint
+        con.execute("PRAGMA synchronous=NORMAL")
+
+
 def ensure_db():
     global DB
+    from .migrations import migrate
     DB = sqlite3.connect(settings.DB_PATH, check_same_thread=False)
+    if not DB.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchone():
+        # новая база: место от удалённых строк возвращается PRAGMA incremental_vacuum (retention.py)
+        DB.execute("PRAGMA auto_vacuum=INCREMENTAL;")
     DB.execute("PRAGMA journal_mode=WAL;")
-    DB.executescript("""
-    CREATE TABLE IF NOT EXISTS users(
-      user_id INTEGER PRIMARY KEY, first_name TEXT, username TEXT,
-      joined_at TEXT, last_seen TEXT, msg_count INTEGER DEFAULT 0);
-    CREATE TABLE IF NOT EXISTS events(
-      id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL,
-      ts TEXT NOT NULL, type TEXT NOT NULL, meta TEXT,
-      FOREIGN KEY(user_id) REFERENCES users(user_id));
-    -- список известных расписаний (по датам)
-    CREATE TABLE IF NOT EXISTS schedules(
-      date_label TEXT PRIMARY KEY,         -- '08.09'
-      link_url   TEXT NOT NULL,
-      google_url TEXT,
-      created_at TEXT NOT NULL
-    );
-    -- хэши листов (чтобы видеть правки)
-    CREATE TABLE IF NOT EXISTS sheet_hashes(
-      date_label TEXT NOT NULL,
-      gid        TEXT NOT NULL,
-      title      TEXT,
-      hash       TEXT NOT NULL,
-      updated_at TEXT NOT NULL,
-      PRIMARY KEY(date_label, gid)
-    );
-    -- настройки пользователей (личный кабинет)
-    CREATE TABLE IF NOT EXISTS user_prefs(
-      user_id       INTEGER PRIMARY KEY,
-      notify_new    INTEGER NOT NULL DEFAULT 1,
-      notify_change INTEGER NOT NULL DEFAULT 1,
-      klass         TEXT,
-      updated_at    TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%S', 'now'))
-    );
-    """); DB.commit()
-
+    tune_connection(DB)
+    migrate(DB)
+    start_writer()
 
 
 def now_utc() -> str:
@@ -52,82 +49,685 @@ def now_utc() -> str:
     return datetime.now(timezone.utc).replace(microsecond=0).isoformat()
 
 
-def upsert_user(u):
-    if DB is None:
+# =========================
+# Потоки: писатель и читатели
+# =========================
+# Писатель обслуживает одну очередь: записи кликов (users/events) копит и пишет пачкой,
+# остальные изменения ("f", fn, args, future) выполняет по порядку, каждое своей транзакцией.
+
+_WQ: "queue.Queue[Optional[tuple]]" = queue.Queue(maxsize=settings.DB_QUEUE_MAX)
+_WRITER: Optional[threading.Thread] = None
+# Аренда лидера продлевается мимо очереди писателя: своё соединение в своём потоке,
+# чтобы забитая кликами очередь не задержала продление дольше срока аренды.
+_LEASER: Optional[ThreadPoolExecutor] = None
+
+# Для /admin
+WRITE_STATS: Dict[str, int] = {
+    "batches": 0, "users": 0, "events": 0, "dropped": 0, "errors": 0, "max_batch": 0, "writes": 0,
+}
+
+
+def _put(item: tuple):
+    """Событие в очередь без ожидания: цикл событий не блокируем, при переполнении событие теряется (dropped)."""
+    if _WRITER is None:
+        _flush(DB, [item])
+        return
+    try:
+        _WQ.put_nowait(item)
+    except queue.Full:
+        WRITE_STATS["dropped"] += 1
+
+
+def _flush(con: Optional[sqlite3.Connection], batch: List[tuple]):
+    """Пачка ("u", uid, first, uname, ts) / ("e", uid, ts, type, meta) -> одна транзакция."""
+    if con is None or not batch:
+        return
+    users: Dict[int, list] = {}
+    events = []
+    for item in batch:
+        if item[0] == "u":
+            _k, uid, first, uname, ts = item
+            cur = users.get(uid)
+            if cur is None:
+                users[uid] = [uid, first, uname, ts, ts, 1]
+            else:
+                cur[1], cur[2], cur[4] = first, uname, ts
+                cur[5] += 1
+        else:
+            events.append(item[1:])
+    with con:
+        new_users = 0
+        if users:
+            ids = list(users)
+            known = con.execute(
+                f"SELECT COUNT(*) FROM users WHERE user_id IN ({','.join('?' * len(ids))})", ids
+            ).fetchone()[0]
+            new_users = len(ids) - known
+        con.executemany(
+            "INSERT INTO users(user_id,first_name,username,joined_at,last_seen,msg_count) VALUES (?,?,?,?,?,?) "
+            "ON CONFLICT(user_id) DO UPDATE SET first_name=excluded.first_name, username=excluded.username, "
+            "last_seen=excluded.last_seen, msg_count=msg_count+excluded.msg_count",
+            list(users.values()),
+        )
+        con.executemany("INSERT INTO events(user_id,ts,type,meta) VALUES (?,?,?,?)", events)
+        _rollup(con, [(uid, ts, t) for uid, ts, t, _m in events], new_users)
+    WRITE_STATS["batches"] += 1
+    WRITE_STATS["users"] += len(users)
+    WRITE_STATS["events"] += len(events)
+    WRITE_STATS["max_batch"] = max(WRITE_STATS["max_batch"], len(batch))
+
+
+# =========================
+# Сводки (rollup) для /admin
+# =========================
+# Обновляются в той же транзакции, что и вставка событий; уведомления (notify_*) не считаются активностью.
+
+ROLLUP_KEEP_DAYS = 90  # сколько дней хранить stats_daily_users / stats_hourly
+_PRUNED_DAY = ""
+
+
+def _rollup(con: sqlite3.Connection, events: List[Tuple[int, str, str]], new_users: int = 0):
+    """events: [(user_id, ts, type)]."""
+    if not events and not new_users:
+        return
+    by_day: Dict[str, set] = {}
+    day_events: Dict[str, int] = {}
+    hour_events: Dict[str, int] = {}
+    types: Dict[str, int] = {}
+    for uid, ts, t in events:
+        day, hour = ts[:10], ts[:13]
+        day_events[day] = day_events.get(day, 0) + 1
+        hour_events[hour] = hour_events.get(hour, 0) + 1
+        types[t] = types.get(t, 0) + 1
+        if not t.startswith("notify_"):
+            by_day.setdefault(day, set()).add(uid)
+
+    upd = "INSERT INTO {t}({k}, {c}) VALUES (?, ?) ON CONFLICT({k}) DO UPDATE SET {c}={c}+excluded.{c}"
+    con.executemany(
+        upd.format(t="stats_totals", k="key", c="value"),
+        [("events", len(events)), ("users", new_users)],
+    )
+    con.executemany(upd.format(t="stats_daily", k="day", c="events"), list(day_events.items()))
+    con.executemany(upd.format(t="stats_hourly", k="hour", c="events"), list(hour_events.items()))
+    con.executemany(upd.format(t="stats_event_types", k="type", c="count"), list(types.items()))
+    for day, uids in by_day.items():
+        cur = con.executemany(
+            "INSERT INTO stats_daily_users(day, user_id) VALUES (?, ?) ON CONFLICT DO NOTHING",
+            [(day, u) for u in uids],
+        )
+        if cur.rowcount > 0:
+            con.execute(upd.format(t="stats_daily", k="day", c="users"), (day, cur.rowcount))
+
+    global _PRUNED_DAY
+    today = max(day_events, default=_PRUNED_DAY)
+    if today != _PRUNED_DAY:
+        _rollup_prune(con)
+        _PRUNED_DAY = today
+
+
+def _rollup_prune(con: sqlite3.Connection):
+    from datetime import datetime, timedelta, timezone
+    edge = (datetime.now(timezone.utc) - timedelta(days=ROLLUP_KEEP_DAYS)).strftime("%Y-%m-%d")
+    con.execute("DELETE FROM stats_daily_users WHERE day < ?", (edge,))
+    con.execute("DELETE FROM stats_hourly WHERE hour < ?", (edge,))
+
+
+def _resolve(fut: asyncio.Future, result: Any, exc: Optional[BaseException]):
+    if fut.cancelled():
         return
-    uid, first, uname = u.id, (u.first_name or "").strip(), (u.username or "").strip()
-    if DB.execute("SELECT 1 FROM users WHERE user_id=?", (uid,)).fetchone():
-        DB.execute("UPDATE users SET first_name=?, username=?, last_seen=?, msg_count=msg_count+1 WHERE user_id=?",
-                   (first, uname, now_utc(), uid))
+    if exc is not None:
+        fut.set_exception(exc)
     else:
-        DB.execute("INSERT INTO users(user_id,first_name,username,joined_at,last_seen,msg_count) VALUES (?,?,?,?,?,1)",
-                   (uid, first, uname, now_utc(), now_utc()))
-    DB.commit()
+        fut.set_result(result)
+
+
+def _run_write(item: tuple):
+    _k, fn, args, fut, loop = item
+    result, exc = None, None
+    try:
+        with DB:
+            result = fn(DB, *args)
+        WRITE_STATS["writes"] += 1
+    except Exception as e:
+        exc = e
+    loop.call_soon_threadsafe(_resolve, fut, result, exc)
+
+
+def _flush_safe(batch: List[tuple]):
+    try:
+        _flush(DB, batch)
+    except Exception as e:
+        WRITE_STATS["errors"] += 1
+        print(f"[db] запись пачки ({len(batch)}): {e}")
+
+
+def _writer_main():
+    stop = False
+    while not stop:
+        batch: List[tuple] = []
+        item = _WQ.get()
+        # добираем пачку кликов: до DB_BATCH записей или DB_FLUSH_INTERVAL секунд
+        deadline = time.monotonic() + settings.DB_FLUSH_INTERVAL
+        while True:
+            if item is None:
+                stop = True
+            elif item[0] == "f":
+                # изменение с ожидающим результатом: сначала накопленные клики, потом оно
+                _flush_safe(batch)
+                batch = []
+                _run_write(item)
+            else:
+                batch.append(item)
+            if stop or len(batch) >= settings.DB_BATCH:
+                break
+            left = deadline - time.monotonic()
+            if batch and left <= 0:
+                break
+            try:
+                item = _WQ.get(timeout=left) if batch else _WQ.get_nowait()
+            except queue.Empty:
+                break
+        _flush_safe(batch)
+
+
+def start_writer():
+    global _WRITER, _READERS, _LEASER
+    if _WRITER is None or not _WRITER.is_alive():
+        _WRITER = threading.Thread(target=_writer_main, name="db-writer", daemon=True)
+        _WRITER.start()
+    if _READERS is None:
+        _READERS = ThreadPoolExecutor(max_workers=settings.DB_READERS, thread_name_prefix="db-reader")
+    if _LEASER is None:
+        _LEASER = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-lease")
+
+
+def stop_writer(timeout: float = 10.0):
+    """Дописывает очередь и останавливает потоки БД (вызывается при остановке бота)."""
+    global _WRITER, _READERS, _LEASER
+    if _WRITER is not None:
+        _WQ.put(None)
+        _WRITER.join(timeout)
+        _WRITER = None
+    if _READERS is not None:
+        _READERS.shutdown(wait=False)
+        _READERS = None
+    if _LEASER is not None:
+        _LEASER.shutdown(wait=False)
+        _LEASER = None
+
+
+def _reader_con() -> sqlite3.Connection:
+    con = getattr(_LOCAL, "con", None)
+    if con is None:
+        uri = Path(settings.DB_PATH).resolve().as_uri() + "?mode=ro"
+        con = sqlite3.connect(uri, uri=True, timeout=30)
+        tune_connection(con, readonly=True)
+        _LOCAL.con = con
+    return con
+
+
+def _run_read(fn: Callable[..., Any], args: tuple) -> Any:
+    return fn(_reader_con(), *args)
+
+
+async def _read(fn: Callable[..., Any], *args) -> Any:
+    """fn(con, *args) на соединении только для чтения в пуле потоков."""
+    if _READERS is None:
+        return fn(DB, *args)
+    return await asyncio.get_running_loop().run_in_executor(_READERS, _run_read, fn, args)
+
+
+def _lease_con() -> sqlite3.Connection:
+    con = getattr(_LOCAL, "lease_con", None)
+    if con is None:
+        con = sqlite3.connect(settings.DB_PATH, timeout=5)
+        tune_connection(con)
+        _LOCAL.lease_con = con
+    return con
+
+
+def _run_lease(fn: Callable[..., Any], args: tuple) -> Any:
+    con = _lease_con()
+    with con:
+        return fn(con, *args)
+
+
+async def _lease_write(fn: Callable[..., Any], *args) -> Any:
+    """fn(con, *args) одной транзакцией на отдельном соединении потока db-lease (не через очередь писателя)."""
+    if _LEASER is None:
+        with DB:
+            return fn(DB, *args)
+    return await asyncio.get_running_loop().run_in_executor(_LEASER, _run_lease, fn, args)
+
+
+async def _write(fn: Callable[..., Any], *args) -> Any:
+    """fn(con, *args) в потоке-писателе, одной транзакцией; ждём результат."""
+    if _WRITER is None:
+        with DB:
+            return fn(DB, *args)
+    loop = asyncio.get_running_loop()
+    fut = loop.create_future()
+    item = ("f", fn, args, fut, loop)
+    try:
+        _WQ.put_nowait(item)
+    except queue.Full:
+        # очередь забита кликами — ждём места, не блокируя цикл событий
+        await loop.run_in_executor(None, _WQ.put, item)
+    return await fut
+
+
+def _all(con: sqlite3.Connection, sql: str, params: tuple = ()) -> List[tuple]:
+    return con.execute(sql, params).fetchall()
+
+
+def _one(con: sqlite3.Connection, sql: str, params: tuple = ()) -> Optional[tuple]:
+    return con.execute(sql, params).fetchone()
+
+
+async def fetch_all(sql: str, params: tuple = ()) -> List[tuple]:
+    """Произвольный SELECT (для /admin и т. п.) вне цикла событий."""
+    if DB is None:
+        return []
+    return await _read(_all, sql, params)
+
+
+async def fetch_one(sql: str, params: tuple = ()) -> Optional[tuple]:
+    if DB is None:
+        return None
+    return await _read(_one, sql, params)
+
+
+# =========================
+# Клики: users/events (отложенная запись)
+# =========================
+
+async def upsert_user(u):
+    if DB is None:
+        return
+    item = ("u", u.id, (u.first_name or "").strip(), (u.username or "").strip(), now_utc())
+    if _WRITER is None:
+        _flush(DB, [item])
+        return
+    try:
+        _WQ.put_nowait(item)
+    except queue.Full:
+        # пользователя не теряем: ждём места в очереди в пуле потоков, не блокируя цикл событий
+        await asyncio.get_running_loop().run_in_executor(None, _WQ.put, item)
 
 
 def log_event(uid: int, t: str, meta: str = ""):
     if DB is None:
         return
-    DB.execute("INSERT INTO events(user_id,ts,type,meta) VALUES (?,?,?,?)", (uid, now_utc(), t, meta)); DB.commit()
+    _put(("e", uid, now_utc(), t, meta))
+
 
+def log_events_many(rows: List[Tuple[int, str, str]]):
+    """[(user_id, type, meta)] — в ту же очередь."""
+    if DB is None:
+        return
+    ts = now_utc()
+    for u, t, m in rows:
+        _put(("e", u, ts, t, m))
+
+
+def _admin_summary(con: sqlite3.Connection) -> Dict[str, Any]:
+    """Только сводки и индексные выборки — время не зависит от размера истории."""
+    from datetime import datetime, timedelta, timezone
+    since = (datetime.now(timezone.utc) - timedelta(days=1)).replace(microsecond=0).isoformat()
+    totals = dict(con.execute("SELECT key, value FROM stats_totals").fetchall())
+    return {
+        "users": totals.get("users", 0),
+        "events": totals.get("events", 0),
+        # users.last_seen обновляется при каждом действии — диапазон по индексу
+        "active_24h": con.execute("SELECT COUNT(*) FROM users WHERE last_seen >= ?", (since,)).fetchone()[0],
+        "days": con.execute("SELECT day, users, events FROM stats_daily ORDER BY day DESC LIMIT 7").fetchall(),
+        "types": con.execute("SELECT type, count FROM stats_event_types ORDER BY count DESC LIMIT 8").fetchall(),
+        "top": con.execute(
+            "SELECT user_id, first_name, username, msg_count, last_seen FROM users "
+            "ORDER BY msg_count DESC, last_seen DESC LIMIT 10"
+        ).fetchall(),
+        "last": con.execute(
+            "SELECT e.ts, e.type, e.user_id, u.username, e.meta FROM events e LEFT JOIN users u USING(user_id) "
+            "ORDER BY e.id DESC LIMIT 10"
+        ).fetchall(),
+    }
+
+
+async def admin_summary() -> Dict[str, Any]:
+    """Сводка для /admin одним заходом в пул читателей."""
+    return await _read(_admin_summary)
+
+
+async def user_ids_all() -> List[int]:
+    return [r[0] for r in await fetch_all("SELECT user_id FROM users")]
+
+
+# =========================
+# Расписания, хэши листов, валидаторы
+# =========================
 
-def sched_get_all() -> Dict[str, Tuple[str, Optional[str]]]:
+async def sched_get_all() -> Dict[str, Tuple[str, Optional[str]]]:
     """return {date_label: (link_url, google_url)}"""
-    cur = DB.execute("SELECT date_label, link_url, google_url FROM schedules")
-    return {d: (lu, gu) for d, lu, gu in cur.fetchall()}
+    rows = await fetch_all("SELECT date_label, link_url, google_url FROM schedules")
+    return {d: (lu, gu) for d, lu, gu in rows}
 
 
-def sched_upsert(date_label: str, link_url: str, google_url: Optional[str]):
-    if DB.execute("SELECT 1 FROM schedules WHERE date_label=?", (date_label,)).fetchone():
-        DB.execute("UPDATE schedules SET link_url=?, google_url=? WHERE date_label=?", (link_url, google_url, date_label))
-    else:
-        DB.execute("INSERT INTO schedules(date_label, link_url, google_url, created_at) VALUES (?,?,?,?)",
-                   (date_label, link_url, google_url, now_utc()))
-    DB.commit()
+async def sched_recent(limit: int) -> List[str]:
+    """Последние известные даты (по времени появления)."""
+    rows = await fetch_all("SELECT date_label FROM schedules ORDER BY created_at DESC LIMIT ?", (limit,))
+    return [r[0] for r in rows]
+
+
+def _sched_upsert(con: sqlite3.Connection, date_label: str, link_url: str, google_url: Optional[str]):
+    con.execute(
+        "INSERT INTO schedules(date_label, link_url, google_url, created_at) VALUES (?,?,?,?) "
+        "ON CONFLICT(date_label) DO UPDATE SET link_url=excluded.link_url, google_url=excluded.google_url",
+        (date_label, link_url, google_url, now_utc()),
+    )
+
 
+async def sched_upsert(date_label: str, link_url: str, google_url: Optional[str]):
+    await _write(_sched_upsert, date_label, link_url, google_url)
 
-def hash_get(date_label: str, gid: str) -> Optional[str]:
-    row = DB.execute("SELECT hash FROM sheet_hashes WHERE date_label=? AND gid=?", (date_label, gid)).fetchone()
+
+async def hash_get(date_label: str, gid: str) -> Optional[str]:
+    row = await fetch_one("SELECT hash FROM sheet_hashes WHERE date_label=? AND gid=?", (date_label, gid))
     return row[0] if row else None
 
 
-def hash_set(date_label: str, gid: str, title: str, h: str):
-    if DB.execute("SELECT 1 FROM sheet_hashes WHERE date_label=? AND gid=?", (date_label, gid)).fetchone():
-        DB.execute("UPDATE sheet_hashes SET title=?, hash=?, updated_at=? WHERE date_label=? AND gid=?",
-                   (title, h, now_utc(), date_label, gid))
+def _hash_set(con: sqlite3.Connection, date_label: str, gid: str, title: str, h: str):
+    con.execute(
+        "INSERT INTO sheet_hashes(date_label, gid, title, hash, updated_at) VALUES (?,?,?,?,?) "
+        "ON CONFLICT(date_label, gid) DO UPDATE SET title=excluded.title, hash=excluded.hash, "
+        "updated_at=excluded.updated_at",
+        (date_label, gid, title, h, now_utc()),
+    )
+
+
+async def hash_set(date_label: str, gid: str, title: str, h: str):
+    await _write(_hash_set, date_label, gid, title, h)
+
+
+async def hashes_since(ts: str) -> List[Tuple[str, str, str, str]]:
+    """Версии листов, записанные не раньше ts. -> [(date_label, gid, hash, updated_at)]."""
+    return await fetch_all(
+        "SELECT date_label, gid, hash, updated_at FROM sheet_hashes WHERE updated_at >= ?", (ts,)
+    )
+
+
+async def validators_get(url: str) -> Optional[Dict[str, Any]]:
+    row = await fetch_one("SELECT etag, last_modified, length, digest FROM http_validators WHERE url=?", (url,))
+    if not row:
+        return None
+    etag, lm, length, digest = row
+    return {"etag": etag, "last_modified": lm, "length": length, "digest": digest}
+
+
+def _validators_set(con: sqlite3.Connection, url: str, etag, last_modified, length, digest):
+    con.execute(
+        "INSERT INTO http_validators(url, etag, last_modified, length, digest, updated_at) VALUES (?,?,?,?,?,?) "
+        "ON CONFLICT(url) DO UPDATE SET etag=excluded.etag, last_modified=excluded.last_modified, "
+        "length=excluded.length, digest=excluded.digest, updated_at=excluded.updated_at",
+        (url, etag, last_modified, length, digest, now_utc()),
+    )
+
+
+async def validators_set(url: str, etag: Optional[str], last_modified: Optional[str], length: Optional[int], digest: str):
+    await _write(_validators_set, url, etag, last_modified, length, digest)
+
+
+# =========================
+# outbox (очередь рассылки)
+# =========================
+
+def _outbox_add(con: sqlite3.Connection, items: List[Tuple[int, str, str, str]]):
+    ts = now_utc()
+    con.executemany(
+        "INSERT INTO outbox(user_id, text, event, meta, created_at) VALUES (?,?,?,?,?)",
+        [(uid, text, ev, meta, ts) for uid, text, ev, meta in items],
+    )
+
+
+async def outbox_add(items: List[Tuple[int, str, str, str]]):
+    """items: [(user_id, text, event, meta)] — одной транзакцией."""
+    if DB is None or not items:
+        return
+    await _write(_outbox_add, items)
+
+
+async def outbox_pending(limit: int) -> List[Tuple[int, int, str, str, str, int]]:
+    """-> [(id, user_id, text, event, meta, attempts)] в порядке постановки."""
+    return await fetch_all(
+        "SELECT id, user_id, text, event, meta, attempts FROM outbox WHERE status=0 ORDER BY id LIMIT ?", (limit,)
+    )
+
+
+async def outbox_count() -> int:
+    row = await fetch_one("SELECT COUNT(*) FROM outbox WHERE status=0")
+    return row[0] if row else 0
+
+
+def _outbox_done(con: sqlite3.Connection, sent, failed):
+    ts = now_utc()
+    con.executemany("DELETE FROM outbox WHERE id=?", [(i,) for i, _u, _e, _m in sent])
+    con.executemany(
+        "UPDATE outbox SET status=2, attempts=?, error=? WHERE id=?",
+        [(a, err, i) for i, _u, _e, _m, a, err in failed],
+    )
+    events = [(u, ts, f"{e}_sent", m) for _i, u, e, m in sent] + [
+        (u, ts, f"{e}_error", f"{m}|{err}") for _i, u, e, m, _a, err in failed
+    ]
+    con.executemany("INSERT INTO events(user_id,ts,type,meta) VALUES (?,?,?,?)", events)
+    _rollup(con, [(u, t, ty) for u, t, ty, _m in events])
+
+
+async def outbox_done(sent: List[Tuple[int, int, str, str]], failed: List[Tuple[int, int, str, str, int, str]]):
+    """
+    Итог пачки рассылки одной транзакцией: доставленные удаляются из очереди,
+    недоставленные помечаются; события *_sent / *_error пишутся в events.
+    sent: [(id, user_id, event, meta)], failed: [(id, user_id, event, meta, attempts, error)].
+    """
+    if DB is None or not (sent or failed):
+        return
+    await _write(_outbox_done, sent, failed)
+
+
+# =========================
+# Хранение истории (см. retention.py)
+# =========================
+
+def archive_path(month: str) -> str:
+    """Файл архива сырых событий за месяц 'YYYY-MM' рядом с основной базой."""
+    p = Path(settings.DB_PATH)
+    return str(p.with_name(f"{p.stem}-events-{month}{p.suffix or '.db'}"))
+
+
+def _events_expire_batch(con: sqlite3.Connection, before: str, limit: int, archive: bool) -> int:
+    """
+    Убирает до limit самых старых событий с ts < before (одного месяца за раз).
+    archive=True — переносит их в помесячный файл, иначе просто удаляет.
+    Сводки stats_* уже посчитаны при вставке, так что статистика за всё время не теряется.
+    """
+    row = con.execute("SELECT ts FROM events WHERE ts < ? ORDER BY ts LIMIT 1", (before,)).fetchone()
+    if not row:
+        return 0
+    month = row[0][:7]
+    hi = min(before, _next_month(month))
+    rows = con.execute(
+        "SELECT id, user_id, ts, type, meta FROM events WHERE ts >= ? AND ts < ? ORDER BY ts LIMIT ?",
+        (month, hi, limit),
+    ).fetchall()
+    if archive:
+        con.execute("ATTACH DATABASE ? AS arch", (archive_path(month),))
+        try:
+            con.execute(
+                "CREATE TABLE IF NOT EXISTS arch.events("
+                "id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, ts TEXT NOT NULL, type TEXT NOT NULL, meta TEXT)"
+            )
+            con.executemany("INSERT OR IGNORE INTO arch.events(id, user_id, ts, type, meta) VALUES (?,?,?,?,?)", rows)
+            con.executemany("DELETE FROM main.events WHERE id=?", [(r[0],) for r in rows])
+            con.commit()
+        finally:
+            con.execute("DETACH DATABASE arch")
     else:
-        DB.execute("INSERT INTO sheet_hashes(date_label, gid, title, hash, updated_at) VALUES (?,?,?,?,?)",
-                   (date_label, gid, title, h, now_utc()))
-    DB.commit()
+        con.executemany("DELETE FROM events WHERE id=?", [(r[0],) for r in rows])
+    return len(rows)
+
+
+def _next_month(month: str) -> str:
+    y, m = int(month[:4]), int(month[5:7])
+    return f"{y + m // 12:04d}-{m % 12 + 1:02d}"
+
+
+async def events_expire_batch(before: str, limit: int, archive: bool) -> int:
+    if DB is None:
+        return 0
+    return await _write(_events_expire_batch, before, limit, archive)
+
+
+def _outbox_prune(con: sqlite3.Connection, before: str) -> int:
+    return con.execute("DELETE FROM outbox WHERE status=2 AND created_at < ?", (before,)).rowcount
+
+
+async def outbox_prune(before: str) -> int:
+    """Удаляет старые недоставленные уведомления (status=2)."""
+    if DB is None:
+        return 0
+    return await _write(_outbox_prune, before)
+
+
+def _maintenance(con: sqlite3.Connection, vacuum_pages: int) -> Dict[str, int]:
+    con.commit()
+    freelist = con.execute("PRAGMA freelist_count").fetchone()[0]
+    if con.execute("PRAGMA auto_vacuum").fetchone()[0] == 2 and freelist:
+        # модуль sqlite3 делает один шаг оператора, а incremental_vacuum освобождает страницу за шаг,
+        # поэтому повторяем по странице внутри одной транзакции
+        con.execute("BEGIN")
+        for _ in range(min(freelist, vacuum_pages)):
+            con.execute("PRAGMA incremental_vacuum(1)")
+        con.commit()
+    con.execute("PRAGMA optimize")
+    return {
+        "freelist_before": freelist,
+        "freelist": con.execute("PRAGMA freelist_count").fetchone()[0],
+        "pages": con.execute("PRAGMA page_count").fetchone()[0],
+    }
+
+
+async def maintenance(vacuum_pages: int) -> Dict[str, int]:
+    """PRAGMA optimize + incremental_vacuum (если база в режиме auto_vacuum=INCREMENTAL)."""
+    if DB is None:
+        return {}
+    return await _write(_maintenance, vacuum_pages)
 
 
 # =========================
-# user_prefs (личный кабинет)
+# Каталог вкладок: параллель -> gid (см. ensure.py)
 # =========================
 
-def _ensure_prefs_row(user_id: int):
-    """Гарантирует наличие строки в user_prefs с дефолтами."""
+def _catalog_record(con: sqlite3.Connection, doc_id: str, gid: str, digest: str, labels: Dict[int, List[str]]):
+    con.execute("DELETE FROM sheet_catalog WHERE doc_id=? AND gid=?", (doc_id, gid))
+    ts = now_utc()
+    con.executemany(
+        "INSERT INTO sheet_catalog(doc_id, gid, grade, labels, digest, updated_at) VALUES (?,?,?,?,?,?)",
+        [(doc_id, gid, g, ",".join(ls), digest, ts) for g, ls in labels.items()],
+    )
+
+
+async def catalog_record(doc_id: str, gid: str, digest: str, labels: Dict[int, List[str]]):
+    """Запомнить, какие параллели (и классы) на вкладке этой версии листа."""
     if DB is None:
         return
-    if not DB.execute("SELECT 1 FROM user_prefs WHERE user_id=?", (user_id,)).fetchone():
-        DB.execute("INSERT INTO user_prefs(user_id) VALUES (?)", (user_id,))
-        DB.commit()
+    await _write(_catalog_record, doc_id, gid, digest, labels)
 
 
-def prefs_get(user_id: int) -> Dict[str, Any]:
-    """Возвращает словарь настроек пользователя."""
+def _catalog_guess(con: sqlite3.Connection, doc_id: str, grade: int) -> List[str]:
+    rows = con.execute(
+        "SELECT gid FROM sheet_catalog WHERE doc_id=? AND grade=? ORDER BY updated_at DESC", (doc_id, grade)
+    ).fetchall()
+    # других таблиц: новые даты обычно копия прежней, вкладки с теми же gid
+    rows += con.execute(
+        "SELECT gid FROM sheet_catalog WHERE grade=? AND doc_id<>? "
+        "GROUP BY gid ORDER BY MAX(updated_at) DESC LIMIT 5",
+        (grade, doc_id),
+    ).fetchall()
+    return list(dict.fromkeys(r[0] for r in rows))
+
+
+async def catalog_guess(doc_id: str, grade: int) -> List[str]:
+    """gid-кандидаты для параллели: сначала из этой таблицы, потом самые свежие из других."""
     if DB is None:
-        return {"user_id": user_id, "notify_new": 1, "notify_change": 1, "klass": None}
-    _ensure_prefs_row(user_id)
-    row = DB.execute(
-        "SELECT user_id, notify_new, notify_change, klass FROM user_prefs WHERE user_id=?",
-        (user_id,)
-    ).fetchone()
+        return []
+    return await _read(_catalog_guess, doc_id, grade)
+
+
+# =========================
+# Аренда ролей между репликами (см. leader.py)
+# =========================
+
+def _lease_acquire(con: sqlite3.Connection, name: str, holder: str, ttl: float) -> Tuple[Optional[str], float]:
+    now = time.time()
+    # берём, если строки нет, она наша (продление) или срок чужой аренды истёк — одним оператором
+    con.execute(
+        "INSERT INTO leases(name, holder, expires_at, acquired_at) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT(name) DO UPDATE SET "
+        "  acquired_at=CASE WHEN leases.holder=excluded.holder THEN leases.acquired_at ELSE excluded.acquired_at END, "
+        "  holder=excluded.holder, expires_at=excluded.expires_at "
+        "WHERE leases.holder=excluded.holder OR leases.expires_at < ?",
+        (name, holder, now + ttl, now, now),
+    )
+    row = con.execute("SELECT holder, expires_at FROM leases WHERE name=?", (name,)).fetchone()
+    return row[0], row[1]
+
+
+async def lease_acquire(name: str, holder: str, ttl: float) -> Tuple[Optional[str], float]:
+    """Взять/продлить аренду name на ttl секунд. -> (текущий владелец, срок до time.time())."""
+    return await _lease_write(_lease_acquire, name, holder, ttl)
+
+
+def _lease_release(con: sqlite3.Connection, name: str, holder: str):
+    con.execute("UPDATE leases SET expires_at=0 WHERE name=? AND holder=?", (name, holder))
+
+
+async def lease_release(name: str, holder: str):
+    """Отдать аренду досрочно (при остановке), чтобы другая реплика подхватила без ожидания ttl."""
+    if DB is None:
+        return
+    await _lease_write(_lease_release, name, holder)
+
+
+# =========================
+# user_prefs (личный кабинет)
+# =========================
+
+_PREFS_DEFAULT = {"notify_new": 1, "notify_change": 1, "klass": None}
+
+
+def _ensure_prefs_row(con: sqlite3.Connection, user_id: int):
+    """Гарантирует наличие строки в user_prefs с дефолтами."""
+    con.execute("INSERT INTO user_prefs(user_id) VALUES (?) ON CONFLICT(user_id) DO NOTHING", (user_id,))
+
+
+async def prefs_get(user_id: int) -> Dict[str, Any]:
+    """Возвращает словарь настроек пользователя (строки ещё нет — создаёт её со значениями по умолчанию)."""
+    row = await fetch_one(
+        "SELECT user_id, notify_new, notify_change, klass FROM user_prefs WHERE user_id=?", (user_id,)
+    )
+    if not row:
+        # рассылки выбирают получателей по строкам user_prefs: без строки показанные «вкл.» не сработали бы
+        if DB is not None:
+            await _write(_ensure_prefs_row, user_id)
+        return {"user_id": user_id, **_PREFS_DEFAULT}
     uid, n_new, n_chg, klass = row
     return {"user_id": uid, "notify_new": int(n_new), "notify_change": int(n_chg), "klass": klass}
 
 
-def prefs_set(
+def _prefs_set(con: sqlite3.Connection, user_id: int, fields: List[str], vals: List[Any]):
+    _ensure_prefs_row(con, user_id)
+    con.execute(f"UPDATE user_prefs SET {', '.join(fields)} WHERE user_id=?", (*vals, user_id))
+
+
+async def prefs_set(
     user_id: int,
     *,
     notify_new: Optional[bool] = None,
@@ -137,7 +737,6 @@ def prefs_set(
     """Частично обновляет настройки пользователя. Поля с None/_NOARG — см. сигнатуру."""
     if DB is None:
         return
-    _ensure_prefs_row(user_id)
     fields, vals = [], []
     if notify_new is not None:
         fields.append("notify_new=?"); vals.append(int(bool(notify_new)))
@@ -148,44 +747,39 @@ def prefs_set(
     if not fields:
         return
     fields.append("updated_at=?"); vals.append(now_utc())
-    vals.append(user_id)
-    DB.execute(f"UPDATE user_prefs SET {', '.join(fields)} WHERE user_id=?", vals)
-    DB.commit()
+    await _write(_prefs_set, user_id, fields, vals)
 
 
-def prefs_toggle(user_id: int, field: str) -> int:
-    """Переключает флаг notify_new|notify_change. Возвращает новое значение (0/1)."""
-    assert field in {"notify_new", "notify_change"}
-    if DB is None:
-        return 0
-    _ensure_prefs_row(user_id)
-    cur = DB.execute(f"SELECT {field} FROM user_prefs WHERE user_id=?", (user_id,))
-    row = cur.fetchone()
+def _prefs_toggle(con: sqlite3.Connection, user_id: int, field: str) -> int:
+    _ensure_prefs_row(con, user_id)
+    row = con.execute(f"SELECT {field} FROM user_prefs WHERE user_id=?", (user_id,)).fetchone()
     current = int(row[0]) if row else 1
     new_val = 0 if current else 1
-    DB.execute(f"UPDATE user_prefs SET {field}=?, updated_at=? WHERE user_id=?",
-               (new_val, now_utc(), user_id))
-    DB.commit()
+    con.execute(f"UPDATE user_prefs SET {field}=?, updated_at=? WHERE user_id=?", (new_val, now_utc(), user_id))
     return new_val
 
 
-def prefs_users_for_new() -> List[int]:
-    """Пользователи, подписанные на новые расписания и указавшие класс."""
+async def prefs_toggle(user_id: int, field: str) -> int:
+    """Переключает флаг notify_new|notify_change. Возвращает новое значение (0/1)."""
+    assert field in {"notify_new", "notify_change"}
     if DB is None:
-        return []
-    return [r[0] for r in DB.execute("SELECT user_id FROM user_prefs WHERE notify_new=1 AND klass IS NOT NULL")]
+        return 0
+    return await _write(_prefs_toggle, user_id, field)
 
 
-def prefs_users_for_changes() -> List[int]:
-    """Пользователи, подписанные на уведомления об изменениях."""
-    if DB is None:
-        return []
-    return [r[0] for r in DB.execute("SELECT user_id FROM user_prefs WHERE notify_change=1")]
+async def prefs_users_for_new_with_class() -> List[Tuple[int, str]]:
+    """(user_id, класс) подписанных на новые расписания — одним запросом."""
+    return [(r[0], r[1]) for r in await fetch_all(
+        "SELECT user_id, klass FROM user_prefs WHERE notify_new=1 AND klass IS NOT NULL"
+    )]
 
 
-def prefs_get_user_class(user_id: int) -> Optional[str]:
+async def prefs_users_for_changes_with_class() -> List[Tuple[int, Optional[str]]]:
+    """(user_id, класс) подписанных на изменения — одним запросом."""
+    return [(r[0], r[1]) for r in await fetch_all("SELECT user_id, klass FROM user_prefs WHERE notify_change=1")]
+
+
+async def prefs_get_user_class(user_id: int) -> Optional[str]:
     """Возвращает выбранный класс пользователя или None."""
-    if DB is None:
-        return None
-    row = DB.execute("SELECT klass FROM user_prefs WHERE user_id=?", (user_id,)).fetchone()
+    row = await fetch_one("SELECT klass FROM user_prefs WHERE user_id=?", (user_id,))
     return row[0] if row else None
@@ -0,0 +1,92 @@
+import html
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from .parser import _time_key
+
+# Урок после collapse_by_time: (время, предмет, кабинет)
+Lesson = Tuple[str, str, Optional[str]]
+
+
+@dataclass
+class LessonChange:
+    kind: str                  # "subject" | "cabinet" | "time" | "added" | "removed"
+    time: str                  # время урока (для removed — старое)
+    subject: str
+    old: Optional[str] = None  # прежнее значение (предмет/кабинет/время)
+    new: Optional[str] = None  # новое значение
+
+
+def _by_time(items: List[Lesson]) -> Dict[str, Lesson]:
+    out: Dict[str, Lesson] = {}
+    for it in items:
+        out.setdefault(_time_key(it[0]), it)
+    return out
+
+
+def _cab_change(old: Lesson, new: Lesson) -> Optional[LessonChange]:
+    if (old[2] or None) != (new[2] or None):
+        return LessonChange("cabinet", new[0], new[1], old[2], new[2])
+    return None
+
+
+def diff_lessons(old: List[Lesson], new: List[Lesson]) -> List[LessonChange]:
+    """Поурочный diff одного класса: совпадение по времени, затем перенос по предмету."""
+    o, n = _by_time(old), _by_time(new)
+    out: List[LessonChange] = []
+
+    for k in [k for k in n if k in o]:
+        a, b = o[k], n[k]
+        if a[1] != b[1]:
+            out.append(LessonChange("subject", b[0], b[1], a[1], b[1]))
+        ch = _cab_change(a, b)
+        if ch:
+            out.append(ch)
+
+    removed = [o[k] for k in o if k not in n]
+    added = [n[k] for k in n if k not in o]
+    # тот же предмет в другое время — перенос, а не «удалён + добавлен»
+    for a in list(removed):
+        b = next((x for x in added if x[1] == a[1]), None)
+        if b is None:
+            continue
+        removed.remove(a)
+        added.remove(b)
+        out.append(LessonChange("time", b[0], b[1], a[0], b[0]))
+        ch = _cab_change(a, b)
+        if ch:
+            out.append(ch)
+    out += [LessonChange("added", b[0], b[1], None, b[2]) for b in added]
+    out += [LessonChange("removed", a[0], a[1], a[2], None) for a in removed]
+
+    out.sort(key=lambda c: _time_key(c.time))
+    return out
+
+
+def diff_sheet(old: Dict[str, List[Lesson]], new: Dict[str, List[Lesson]]) -> Dict[str, List[LessonChange]]:
+    """{класс: [изменения]} — только затронутые классы."""
+    out: Dict[str, List[LessonChange]] = {}
+    for label in set(old) | set(new):
+        ch = diff_lessons(old.get(label) or [], new.get(label) or [])
+        if ch:
+            out[label] = ch
+    return out
+
+
+def render_changes(date_label: str, klass: str, changes: List[LessonChange]) -> str:
+    e = html.escape
+    lines = [f"✏️ <b>Изменения в расписании на {e(date_label)}</b>", f"Класс: <b>{e(klass)}</b>", ""]
+    for c in changes:
+        t = f"({e(c.time)}) " if c.time else ""
+        if c.kind == "subject":
+            lines.append(f"🔄 {t}<s>{e(c.old or '—')}</s> → <b>{e(c.new or '—')}</b>")
+        elif c.kind == "cabinet":
+            lines.append(f"🚪 {t}{e(c.subject)}: кабинет {e(c.old or '—')} → <b>{e(c.new or '—')}</b>")
+        elif c.kind == "time":
+            lines.append(f"🕒 {e(c.subject)}: {e(c.old or '—')} → <b>{e(c.new or '—')}</b>")
+        elif c.kind == "added":
+            cab = f", каб. {e(c.new)}" if c.new else ""
+            lines.append(f"➕ {t}<b>{e(c.subject)}</b>{cab}")
+        elif c.kind == "removed":
+            lines.append(f"➖ {t}<s>{e(c.subject)}</s>")
+    return "\n".join(lines)
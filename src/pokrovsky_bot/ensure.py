@@ -1,76 +1,211 @@
 import asyncio
-import csv
-from io import StringIO
+import hashlib
 from typing import Dict, List, Optional, Set, Tuple
-import aiohttp
-from .config import HEADERS
-from .db import sched_upsert
+from .cache import approx_sizeof
+from .db import catalog_guess, catalog_record, sched_upsert
+from .grid import SheetGrid
 from .http import fetch_text
-from .sheets import resolve_google_url, sheets_meta, csv_url
-from .site import get_links_from_site
-from .state import DOC_URL, GID_BY_GRADE, MATRIX, LINKS
-from .parser import parse_headers, build_cab_map, grade_from_label
+from .sheets import resolve_google_url, sheets_meta, csv_url, spreadsheet_id
+from .links import get_links
+from .singleflight import SingleFlight
+from .state import DOC_URL, GID_BY_GRADE, MATRIX, LINKS, remember_gid
+from .models import SheetData
+from .parser import parse_headers, build_cab_map, grade_from_label, extract_schedule, collapse_by_time, pretty
 
-async def ensure_links():
-    global LINKS
-    if not LINKS:
-        LINKS = await get_links_from_site()
+# Склейка одновременных загрузок: ("url", date), ("meta", date), ("sheet", date, gid), ("probe", date, grade),
+# ("date", date) — все вкладки даты.
+# FLIGHT.coalesced — сколько вызовов дождались чужого запроса вместо своего.
+FLIGHT = SingleFlight()
 
+LOAD_CONCURRENCY = 6  # одновременных загрузок CSV вкладок одной таблицы
 
-async def get_rows_from_csv(g_url: str, gid: str) -> List[List[str]]:
-    text = await fetch_text(csv_url(g_url, gid))
-    return [list(r) for r in csv.reader(StringIO(text))]
+# (doc_id, gid) -> digest версии, уже записанной в sheet_catalog (не пишем повторно)
+_CATALOGED: Dict[Tuple[str, str], str] = {}
+# запись в каталог идёт в фоне, пользователь лист получает не дожидаясь её
+_BG: Set[asyncio.Task] = set()
 
 
-async def ensure_sheet_for_grade(date: str, grade: int):
+def build_sheet(date: str, text: str, with_html: bool = True) -> SheetData:
+    """
+    Парсит CSV-версию листа и сразу считает уроки и HTML для всех его классов.
+    with_html=False — только уроки (для снимка diff и индекса кабинетов), в MATRIX такой лист не кладём.
+    """
+    rows = SheetGrid.from_csv(text)
+    labels, headers = parse_headers(rows)
+    cab_map = build_cab_map(rows, labels, headers)
+    lessons = {
+        L: collapse_by_time(extract_schedule(rows, labels, headers, L, cab_map.get(L, (None, 0))))
+        for L in labels
+    }
+    html = {L: pretty(date, L, items) for L, items in lessons.items()} if with_html else {}
+    sheet = SheetData(
+        rows, labels, headers, cab_map,
+        digest=hashlib.sha256(text.encode("utf-8")).hexdigest(),
+        lessons=lessons, html=html,
+    )
+    sheet.nbytes = rows.nbytes + approx_sizeof((labels, headers, cab_map, lessons, html))
+    return sheet
+
+
+async def doc_url_for_date(date: str) -> str:
     g_url = DOC_URL.get(date)
-    if not g_url:
-        await ensure_links()
+    if g_url:
+        return g_url
+
+    async def load() -> str:
+        await get_links()
         link = next((l for l in LINKS if l.date == date), None)
         if not link:
             raise RuntimeError("Дата не найдена.")
-        g_url = await resolve_google_url(link.url); DOC_URL[date] = g_url; sched_upsert(date, link.url, g_url)
+        url = await resolve_google_url(link.url)
+        DOC_URL[date] = url
+        await sched_upsert(date, link.url, url)
+        return url
 
-    if date in GID_BY_GRADE and grade in GID_BY_GRADE[date]:
-        gid = GID_BY_GRADE[date][grade]
-        if (date, gid) not in MATRIX:
-            rows = await get_rows_from_csv(g_url, gid)
-            labels, headers = parse_headers(rows)
-            MATRIX[(date, gid)] = (rows, labels, headers, build_cab_map(rows, labels, headers))
-        return g_url, GID_BY_GRADE[date][grade], MATRIX[(date, GID_BY_GRADE[date][grade])]
+    return await FLIGHT.do(("url", date), load)
 
-    gid2title, gids = await sheets_meta(g_url)
-    from .state import parse_class_label
-    quick = {grade_from_label(parse_class_label(t) or ""): gid for gid, t in gid2title.items()}
-    if grade in quick and quick[grade]:
-        gid = quick[grade]
-        rows = await get_rows_from_csv(g_url, gid)
-        labels, headers = parse_headers(rows)
-        MATRIX[(date, gid)] = (rows, labels, headers, build_cab_map(rows, labels, headers))
-        GID_BY_GRADE.setdefault(date, {})[grade] = gid
-        return g_url, gid, MATRIX[(date, gid)]
-
-    async with aiohttp.ClientSession(headers=HEADERS) as session:
-        sem = asyncio.Semaphore(6)
-        async def try_gid(gid):
+
+async def meta_for_date(date: str, g_url: str) -> Tuple[Dict[str, str], Set[str]]:
+    return await FLIGHT.do(("meta", date), lambda: sheets_meta(g_url))
+
+
+async def load_sheet(date: str, g_url: str, gid: str) -> SheetData:
+    """Лист (date, gid) из MATRIX или одна общая загрузка CSV + парсинг на всех ожидающих."""
+    payload = MATRIX.get((date, gid))
+    if payload is not None:
+        return payload
+
+    async def load():
+        sheet = build_sheet(date, await fetch_text(csv_url(g_url, gid)))
+        MATRIX[(date, gid)] = sheet
+        _learn_in_background(g_url, gid, sheet)
+        return sheet
+
+    return await FLIGHT.do(("sheet", date, gid), load)
+
+
+async def _learn(g_url: str, gid: str, sheet: SheetData):
+    """Записать в каталог, какие параллели на вкладке (один раз на версию листа)."""
+    try:
+        key = (spreadsheet_id(g_url), gid)
+        if _CATALOGED.get(key) == sheet.digest:
+            return
+        by_grade: Dict[int, List[str]] = {}
+        for L in sheet.labels:
+            g = grade_from_label(L)
+            if g:
+                by_grade.setdefault(g, []).append(L)
+        await catalog_record(key[0], gid, sheet.digest, by_grade)
+        _CATALOGED[key] = sheet.digest
+    except Exception as e:
+        print(f"[ensure] каталог вкладок, gid {gid}: {e!r}")
+
+
+def _learn_in_background(g_url: str, gid: str, sheet: SheetData):
+    t = asyncio.create_task(_learn(g_url, gid, sheet))
+    _BG.add(t)
+    t.add_done_callback(_BG.discard)
+
+
+async def _predicted_gid(date: str, g_url: str, grade: int, gids: Set[str]):
+    """
+    Вкладка параллели по каталогу прошлых разборов: качаем только предсказанный gid
+    и проверяем по свежим меткам классов. -> (gid, лист) или None (тогда перебор).
+    """
+    try:
+        candidates = [g for g in await catalog_guess(spreadsheet_id(g_url), grade) if g in gids]
+    except Exception:
+        return None
+    for gid in candidates[:2]:
+        try:
+            payload = await load_sheet(date, g_url, gid)
+        except Exception:
+            continue
+        if grade in {grade_from_label(L) for L in payload.labels}:
+            return gid, payload
+    return None
+
+
+async def load_all_sheets(date: str) -> Dict[str, SheetData]:
+    """
+    Все вкладки таблицы на дату одной пачкой: каждый gid качается и парсится один раз
+    (до LOAD_CONCURRENCY одновременно), параллели запоминаются в GID_BY_GRADE по меткам классов.
+    -> {gid: лист} в порядке вкладок; не загрузившиеся вкладки пропускаются.
+    """
+    async def load() -> Dict[str, SheetData]:
+        g_url = await doc_url_for_date(date)
+        gid2title, gids = await meta_for_date(date, g_url)
+        order = list(gid2title) + sorted(set(gids) - set(gid2title)) or ["0"]
+        sem = asyncio.Semaphore(LOAD_CONCURRENCY)
+
+        async def one(gid: str) -> Optional[SheetData]:
             async with sem:
                 try:
-                    from .sheets import csv_url as _csv_url
-                    async with session.get(_csv_url(g_url, gid)) as r:
-                        r.raise_for_status()
-                        txt = await r.text()
-                    rws = [list(r) for r in csv.reader(StringIO(txt))]
-                    lm, hr = parse_headers(rws)
-                    if grade in {grade_from_label(L) for L in lm}:
-                        return gid, rws, lm, hr
+                    return await load_sheet(date, g_url, gid)
                 except Exception:
                     return None
-        tasks = [asyncio.create_task(try_gid(g)) for g in (list(gids) or ["0"])]
+
+        sheets = await asyncio.gather(*(one(g) for g in order))
+        out = {gid: sheet for gid, sheet in zip(order, sheets) if sheet is not None}
+        by_grade = dict(GID_BY_GRADE.get(date) or {})
+        for gid, sheet in out.items():
+            for L in sheet.labels:
+                g = grade_from_label(L)
+                if g and g not in by_grade:
+                    by_grade[g] = gid
+        if by_grade:
+            GID_BY_GRADE[date] = by_grade
+        return out
+
+    return await FLIGHT.do(("date", date), load)
+
+
+async def _probe_gid_for_grade(date: str, g_url: str, grade: int, gids: Set[str]):
+    sem = asyncio.Semaphore(LOAD_CONCURRENCY)
+
+    async def try_gid(gid):
+        async with sem:
+            try:
+                payload = await load_sheet(date, g_url, gid)
+            except Exception:
+                return None
+            if grade in {grade_from_label(L) for L in payload.labels}:
+                return gid, payload
+            return None
+
+    tasks = [asyncio.create_task(try_gid(g)) for g in (list(gids) or ["0"])]
+    try:
         for t in asyncio.as_completed(tasks):
             res = await t
             if res:
-                gid, rows, labels, headers = res
-                MATRIX[(date, gid)] = (rows, labels, headers, build_cab_map(rows, labels, headers))
-                GID_BY_GRADE.setdefault(date, {})[grade] = gid
-                return g_url, gid, MATRIX[(date, gid)]
+                return res
+    finally:
+        for t in tasks:
+            t.cancel()
+    return None
+
+
+async def ensure_sheet_for_grade(date: str, grade: int):
+    g_url = await doc_url_for_date(date)
+
+    gid = (GID_BY_GRADE.get(date) or {}).get(grade)
+    if gid:
+        return g_url, gid, await load_sheet(date, g_url, gid)
+
+    gid2title, gids = await meta_for_date(date, g_url)
+    from .state import parse_class_label
+    quick = {grade_from_label(parse_class_label(t) or ""): gid for gid, t in gid2title.items()}
+    if grade in quick and quick[grade]:
+        gid = quick[grade]
+        payload = await load_sheet(date, g_url, gid)
+        remember_gid(date, grade, gid)
+        return g_url, gid, payload
+
+    res = await _predicted_gid(date, g_url, grade, set(gids) | set(gid2title))
+    if res is None:
+        res = await FLIGHT.do(("probe", date, grade), lambda: _probe_gid_for_grade(date, g_url, grade, gids))
+    if res:
+        gid, payload = res
+        remember_gid(date, grade, gid)
+        return g_url, gid, payload
     raise RuntimeError("Не нашёл вкладку для выбранного номера класса.")
@@ -0,0 +1,108 @@
+import csv
+import sys
+from array import array
+from bisect import bisect_left
+from io import StringIO
+from typing import Dict, Iterable, Iterator, List, Sequence, Union
+
+
+class GridRow:
+    """Строка SheetGrid: ведёт себя как list[str] (len, [c], итерация), пустые ячейки — ""."""
+
+    __slots__ = ("_g", "_lo", "_hi", "_w")
+
+    def __init__(self, g: "SheetGrid", r: int) -> None:
+        self._g = g
+        self._lo = g._row_ptr[r]
+        self._hi = g._row_ptr[r + 1]
+        self._w = g._widths[r]
+
+    def __len__(self) -> int:
+        return self._w
+
+    def __getitem__(self, c: Union[int, slice]):
+        if isinstance(c, slice):
+            return [self[i] for i in range(*c.indices(self._w))]
+        if c < 0:
+            c += self._w
+        if not 0 <= c < self._w:
+            raise IndexError("row index out of range")
+        g = self._g
+        i = bisect_left(g._cols, c, self._lo, self._hi)
+        if i < self._hi and g._cols[i] == c:
+            return g._strings[g._vals[i]]
+        return ""
+
+    def __iter__(self) -> Iterator[str]:
+        g = self._g
+        nxt = self._lo
+        for c in range(self._w):
+            if nxt < self._hi and g._cols[nxt] == c:
+                yield g._strings[g._vals[nxt]]
+                nxt += 1
+            else:
+                yield ""
+
+    def __repr__(self) -> str:
+        return repr(list(self))
+
+
+class SheetGrid:
+    """
+    Компактный лист: хранятся только непустые ячейки (CSR-раскладка —
+    смещения строк, номера колонок и индексы в таблицу уникальных строк).
+    Для парсера выглядит как List[List[str]]: rows[r][c], len(rows), rows[:n].
+    """
+
+    __slots__ = ("_row_ptr", "_widths", "_cols", "_vals", "_strings", "nbytes")
+
+    def __init__(self, rows: Iterable[Sequence[str]]) -> None:
+        # колонок в Google Sheets не больше 18 278 — хватает "H"
+        row_ptr, widths = array("I", [0]), array("H")
+        cols, vals = array("H"), array("I")
+        index: Dict[str, int] = {}
+        strings: List[str] = []
+        for row in rows:
+            for c, cell in enumerate(row):
+                if not cell:
+                    continue
+                k = index.get(cell)
+                if k is None:
+                    k = index[cell] = len(strings)
+                    strings.append(sys.intern(cell))
+                cols.append(c)
+                vals.append(k)
+            row_ptr.append(len(cols))
+            widths.append(len(row))
+        self._row_ptr = row_ptr
+        self._widths = widths
+        self._cols = cols
+        self._vals = vals
+        self._strings = tuple(strings)
+        self.nbytes = (
+            sys.getsizeof(row_ptr) + sys.getsizeof(widths) + sys.getsizeof(cols) + sys.getsizeof(vals)
+            + sys.getsizeof(self._strings) + sum(sys.getsizeof(s) for s in strings)
+        )
+
+    @classmethod
+    def from_csv(cls, text: str) -> "SheetGrid":
+        return cls(csv.reader(StringIO(text)))
+
+    def __len__(self) -> int:
+        return len(self._widths)
+
+    def __getitem__(self, r: Union[int, slice]):
+        if isinstance(r, slice):
+            return [GridRow(self, i) for i in range(*r.indices(len(self._widths)))]
+        if r < 0:
+            r += len(self._widths)
+        if not 0 <= r < len(self._widths):
+            raise IndexError("grid index out of range")
+        return GridRow(self, r)
+
+    def __iter__(self) -> Iterator[GridRow]:
+        for r in range(len(self._widths)):
+            yield GridRow(self, r)
+
+    def to_lists(self) -> List[List[str]]:
+        return [list(row) for row in self]
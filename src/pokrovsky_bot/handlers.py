@@ -3,12 +3,8 @@ import io
 import asyncio
 import html
 import re
-import time
 from typing import List, Tuple, Dict, Any, Optional
-from .parser import (
-    collapse_by_time, extract_schedule, pretty, grade_from_label,
-    extract_schedule_anycab, parse_headers
-)
+from .parser import grade_from_label, parse_headers
 from .donations import make_donate_keyboard
 
 from aiogram import F, Bot
@@ -26,11 +22,12 @@ from .config import settings
 from .db import (
     upsert_user,
     log_event,
-    sched_upsert,
     prefs_get,
     prefs_toggle,
     prefs_set,
     prefs_get_user_class,
+    sched_recent,
+    admin_summary,
 )
 from .keyboard import (
     MAIN_KB,
@@ -40,10 +37,11 @@ from .keyboard import (
     classes_kb,
     profile_dates_kb,
 )
-from .parser import collapse_by_time, extract_schedule, pretty, grade_from_label
-from .sheets import resolve_google_url, sheets_meta, csv_url
-from .site import get_links_from_site
+from .sheets import csv_url
+from .links import get_links
 from .http import fetch_text
+from .ensure import doc_url_for_date, meta_for_date
+from .cabinets import cabinet_index
 from .state import (
     LINKS,
     DOC_URL,
@@ -63,7 +61,7 @@ from aiogram.types import Message  # если ещё не импортирова
 
 async def on_donate(m):
     from .config import settings
-    upsert_user(m.from_user); log_event(m.from_user.id, "donate_open")
+    await upsert_user(m.from_user); log_event(m.from_user.id, "donate_open")
 
     url_cb = (settings.DONATE_CRYPTOBOT_URL or "").strip()
     url_he = (settings.DONATE_HELEKET_URL or "").strip()
@@ -86,9 +84,6 @@ async def on_donate(m):
 
 
 
-_LINKS_LAST_FETCH_AT = 0.0
-_LINKS_TTL_SECONDS = 60.0
-
 def _csv_to_rows(csv_text: str) -> List[List[str]]:
     f = io.StringIO(csv_text)
     reader = csv.reader(f, delimiter=",", quotechar='"')
@@ -135,15 +130,6 @@ async def replace_loader(loader: Message, text: str, **kw):
                 pass
 
 
-async def ensure_links(force: bool = False):
-    """Подтягиваем список дат с сайта. force=True — игнор кэша (фикс «новая дата не появляется без перезапуска»)."""
-    global LINKS, _LINKS_LAST_FETCH_AT
-    now = time.monotonic()
-    if force or not LINKS or (now - _LINKS_LAST_FETCH_AT) >= _LINKS_TTL_SECONDS:
-        LINKS[:] = await get_links_from_site()
-        _LINKS_LAST_FETCH_AT = now
-
-
 def _klass_sort_key(k: str) -> tuple[int, str]:
     # номер + буква (латиница/кириллица)
     m = re.match(r"^\s*(\d{1,2})\s*([A-Za-zА-Яа-яЁё]+)?\s*$", k)
@@ -169,7 +155,7 @@ def _known_classes_from_matrix() -> List[str]:
 
 
 async def _best_date_label() -> Optional[str]:
-    await ensure_links(force=True)
+    await get_links()
     if LINKS:
         return LINKS[0].date
     if DOC_URL:
@@ -179,7 +165,7 @@ async def _best_date_label() -> Optional[str]:
 
 async def _prepare_all_classes() -> List[str]:
     """
-    Делаем список классов доступным: тянем свежую дату, загружаем параллели (заполняет MATRIX),
+    Делаем список классов доступным: тянем свежую дату, загружаем все её вкладки (заполняет MATRIX),
     чтобы получить полный набор меток классов.
     """
     classes = _known_classes_from_matrix()
@@ -190,48 +176,18 @@ async def _prepare_all_classes() -> List[str]:
     if not date:
         return classes
 
-    g_url = DOC_URL.get(date)
-    if not g_url:
-        link = next((l for l in LINKS if l.date == date), None)
-        if link:
-            try:
-                g_url = await resolve_google_url(link.url)
-                DOC_URL[date] = g_url
-                sched_upsert(date, link.url, g_url)
-            except Exception:
-                g_url = None
-    if not g_url:
-        return classes
-
+    from .ensure import load_all_sheets
     try:
-        gid2title, _ = await sheets_meta(g_url)
+        await load_all_sheets(date)  # все вкладки разом: заполняет MATRIX → labels
     except Exception:
-        gid2title = {}
-
-    if gid2title:
-        from .state import parse_class_label
-        quick = {grade_from_label(parse_class_label(t) or ""): gid for gid, t in gid2title.items()}
-        grades = [g for g in quick.keys() if g]
-        if grades:
-            GID_BY_GRADE[date] = {g: quick[g] for g in grades}
-            from .ensure import ensure_sheet_for_grade
-            for g in grades:
-                try:
-                    await ensure_sheet_for_grade(date, g)  # заполняет MATRIX → labels
-                except Exception:
-                    pass
+        return classes
 
     return _known_classes_from_matrix()
 
 
-def _recent_dates(limit: int = 12) -> List[str]:
+async def _recent_dates(limit: int = 12) -> List[str]:
     try:
-        from .db import DB
-        rows = DB.execute(
-            "SELECT date_label FROM schedules ORDER BY created_at DESC LIMIT ?",
-            (limit,),
-        ).fetchall()
-        dates = [r[0] for r in rows]
+        dates = await sched_recent(limit)
     except Exception:
         dates = []
     if not dates:
@@ -244,14 +200,14 @@ def _recent_dates(limit: int = 12) -> List[str]:
 # =========================
 
 async def cmd_start(m: Message):
-    upsert_user(m.from_user)
+    await upsert_user(m.from_user)
     log_event(m.from_user.id, "cmd_start")
     await m.answer("Ищу расписания (площадка №1)...", reply_markup=MAIN_KB)
     await show_dates(m)
 
 
 async def show_dates(m: Message):
-    await ensure_links(force=True)
+    await get_links()
     if not LINKS:
         return await m.answer("Не нашёл ссылки в секции №1.", reply_markup=MAIN_KB)
     STATE[m.chat.id] = {"step": "dates"}
@@ -259,13 +215,13 @@ async def show_dates(m: Message):
 
 
 async def on_main(m: Message):
-    upsert_user(m.from_user)
+    await upsert_user(m.from_user)
     log_event(m.from_user.id, "click_main")
     await show_dates(m)
 
 
 async def on_back(m: Message):
-    upsert_user(m.from_user)
+    await upsert_user(m.from_user)
     log_event(m.from_user.id, "click_back")
     st = STATE.get(m.chat.id) or {}
     if st.get("step") in (None, "dates"):
@@ -281,18 +237,18 @@ async def on_back(m: Message):
         date, gid, grade = st.get("date"), st.get("gid"), st.get("grade")
         if not (date and gid and grade is not None):
             return await show_dates(m)
-        rows, labels, _hr, _cab = MATRIX.get((date, gid), (None, None, None, None))
-        if rows is None:
+        sheet = MATRIX.get((date, gid))
+        if sheet is None:
             from .ensure import ensure_sheet_for_grade
-            rows, labels, hr, cab = (await ensure_sheet_for_grade(date, grade))[2]
-            MATRIX[(date, gid)] = (rows, labels, hr, cab)
+            _g_url, gid, sheet = await ensure_sheet_for_grade(date, grade)
+        labels = sheet.labels
         ks = [L for L in labels if grade_from_label(L) == grade]
         await m.answer("Выбери класс:", reply_markup=kb_labels(date, gid, ks))
         STATE[m.chat.id] = {"step": "classes", "date": date, "gid": gid, "grade": grade}
 
 
 async def on_news(m: Message):
-    upsert_user(m.from_user)
+    await upsert_user(m.from_user)
     log_event(m.from_user.id, "click_news")
     kb = InlineKeyboardMarkup(
         inline_keyboard=[
@@ -303,8 +259,8 @@ async def on_news(m: Message):
 
 
 async def on_pick_date(c: CallbackQuery):
-    upsert_user(c.from_user)
-    await ensure_links(force=True)
+    await upsert_user(c.from_user)
+    await get_links()
     idx = int(c.data.split(":", 1)[1])
     if idx < 0 or idx >= len(LINKS):
         return await c.answer()
@@ -312,12 +268,10 @@ async def on_pick_date(c: CallbackQuery):
     log_event(c.from_user.id, "pick_date", link.date)
     loader = await show_loader(c, "Загружаю…", "⚙️ Загружаю список классов…")
     try:
-        g_url = await resolve_google_url(link.url)
+        g_url = await doc_url_for_date(link.date)
     except Exception as e:
         return await replace_loader(loader, f"Не удалось найти Google Sheets: {e}")
-    DOC_URL[link.date] = g_url
-    sched_upsert(link.date, link.url, g_url)
-    gid2title, _ = await sheets_meta(g_url)
+    gid2title, _ = await meta_for_date(link.date, g_url)
     from .state import parse_class_label
     quick = {grade_from_label(parse_class_label(t) or ""): gid for gid, t in gid2title.items()}
     grades = [g for g in quick.keys() if g]
@@ -338,16 +292,11 @@ async def on_pick_date(c: CallbackQuery):
 
 
 async def ask_grades(msg_target: Message, date: str):
-    await ensure_links(force=True)
-    g_url = DOC_URL.get(date)
-    if not g_url:
-        link = next((l for l in LINKS if l.date == date), None)
-        if not link:
-            return await msg_target.answer("Не нашёл такую дату.", reply_markup=MAIN_KB)
-        g_url = await resolve_google_url(link.url)
-        DOC_URL[date] = g_url
-        sched_upsert(date, link.url, g_url)
-    gid2title, _ = await sheets_meta(g_url)
+    try:
+        g_url = await doc_url_for_date(date)
+    except Exception:
+        return await msg_target.answer("Не нашёл такую дату.", reply_markup=MAIN_KB)
+    gid2title, _ = await meta_for_date(date, g_url)
     from .state import parse_class_label
     quick = {grade_from_label(parse_class_label(t) or ""): gid for gid, t in gid2title.items()}
     grades = [g for g in quick.keys() if g]
@@ -364,7 +313,7 @@ async def ask_grades(msg_target: Message, date: str):
 
 
 async def on_pick_grade(c: CallbackQuery):
-    upsert_user(c.from_user)
+    await upsert_user(c.from_user)
     _, date, gs = c.data.split(":", 2)
     grade = int(gs)
     log_event(c.from_user.id, "pick_grade", f"{date}|{grade}")
@@ -381,27 +330,24 @@ async def on_pick_grade(c: CallbackQuery):
 
 
 async def on_pick_label(c: CallbackQuery):
-    upsert_user(c.from_user)
+    await upsert_user(c.from_user)
     _, date, gid, klass = c.data.split(":", 3)
     key = (klass or "").upper()
     log_event(c.from_user.id, "pick_class", f"{date}|{key}")
     loader = await show_loader(c, "Загружаю…", "⚙️ Загружаю расписание…")
 
-    if (date, gid) not in MATRIX:
+    payload = MATRIX.get((date, gid))
+    if payload is None:
         try:
             grade = int(re.match(r"(\d{1,2})", key).group(1))
             from .ensure import ensure_sheet_for_grade
-            _g_url, _gid, _payload = await ensure_sheet_for_grade(date, grade)
+            _g_url, gid, payload = await ensure_sheet_for_grade(date, grade)
         except Exception as e:
             return await replace_loader(loader, f"Ошибка доступа к листу: {e}")
 
-    rows, labels, headers, cab_map = MATRIX[(date, gid)]
-    if key not in labels:
+    if key not in payload.labels:
         return await replace_loader(loader, "Такой класс не нашёлся на листе.")
-    items = collapse_by_time(
-        extract_schedule(rows, labels, headers, key, cab_map.get(key, (None, 0)))
-    )
-    await replace_loader(loader, pretty(date, key, items), parse_mode="HTML")
+    await replace_loader(loader, payload.html[key], parse_mode="HTML")
     STATE[c.message.chat.id] = {
         "step": "shown",
         "date": date,
@@ -417,7 +363,7 @@ async def on_pick_label(c: CallbackQuery):
 # Проверка подписки на канал
 # =========================
 
-from .subscription import ALLOWED_STATUSES, make_sub_keyboard
+from .subscription import check_subscription, make_sub_keyboard
 
 async def on_check_subscription(cb: CallbackQuery, bot: Bot):
     try:
@@ -426,12 +372,8 @@ async def on_check_subscription(cb: CallbackQuery, bot: Bot):
         pass
 
     user_id = cb.from_user.id
-    ok = False
-    try:
-        member = await bot.get_chat_member(settings.NEWS_CHANNEL_ID, user_id)
-        ok = getattr(member, "status", None) in ALLOWED_STATUSES
-    except TelegramBadRequest:
-        ok = False
+    # мимо кэша: пользователь только что подписался и просит перепроверить
+    ok = await check_subscription(bot, settings.NEWS_CHANNEL_ID, user_id, force=True)
 
     if ok:
         if cb.message:
@@ -459,9 +401,9 @@ async def on_check_subscription(cb: CallbackQuery, bot: Bot):
 
 async def on_profile_open(m: Message):
     """Открыть личный кабинет (кнопка или /profile)."""
-    upsert_user(m.from_user)
+    await upsert_user(m.from_user)
     log_event(m.from_user.id, "profile_open")
-    prefs = prefs_get(m.from_user.id)
+    prefs = await prefs_get(m.from_user.id)
     await m.answer(
         "Личный кабинет:\n• Включайте/отключайте уведомления\n• Выберите свой класс (номер → буква)\n• Или откройте 📘 Расписание класса",
         reply_markup=profile_kb(prefs),
@@ -481,7 +423,7 @@ async def on_profile_close(cb: CallbackQuery):
 
 
 async def on_profile_back(cb: CallbackQuery):
-    prefs = prefs_get(cb.from_user.id)
+    prefs = await prefs_get(cb.from_user.id)
     try:
         await cb.message.edit_text("Личный кабинет:", reply_markup=profile_kb(prefs))
     except Exception:
@@ -490,8 +432,8 @@ async def on_profile_back(cb: CallbackQuery):
 
 
 async def on_profile_toggle_new(cb: CallbackQuery):
-    val = prefs_toggle(cb.from_user.id, "notify_new")
-    prefs = prefs_get(cb.from_user.id)
+    val = await prefs_toggle(cb.from_user.id, "notify_new")
+    prefs = await prefs_get(cb.from_user.id)
     try:
         await cb.message.edit_reply_markup(reply_markup=profile_kb(prefs))
     except Exception:
@@ -501,8 +443,8 @@ async def on_profile_toggle_new(cb: CallbackQuery):
 
 
 async def on_profile_toggle_chg(cb: CallbackQuery):
-    val = prefs_toggle(cb.from_user.id, "notify_change")
-    prefs = prefs_get(cb.from_user.id)
+    val = await prefs_toggle(cb.from_user.id, "notify_change")
+    prefs = await prefs_get(cb.from_user.id)
     try:
         await cb.message.edit_reply_markup(reply_markup=profile_kb(prefs))
     except Exception:
@@ -513,7 +455,7 @@ async def on_profile_toggle_chg(cb: CallbackQuery):
 
 async def on_profile_choose_class(cb: CallbackQuery):
     """В ЛК: сначала выбор номера (только 5–11), без дат, без расписания."""
-    await ensure_links(force=True)
+    await get_links()
     grades = list(range(5, 12))  # 5–11
     try:
         await cb.message.edit_text("Выберите номер класса (5–11):", reply_markup=profile_grades_kb(grades))
@@ -564,8 +506,8 @@ async def on_profile_choose_grade_letters(cb: CallbackQuery):
 async def on_profile_pick_class(cb: CallbackQuery):
     """Сохраняем выбранный класс и не показываем расписание."""
     klass = cb.data.split(":")[-1].upper()
-    prefs_set(cb.from_user.id, klass=klass)
-    prefs = prefs_get(cb.from_user.id)
+    await prefs_set(cb.from_user.id, klass=klass)
+    prefs = await prefs_get(cb.from_user.id)
     txt = f"Класс установлен: <b>{html.escape(klass)}</b>\n\nЛичный кабинет:"
     try:
         await cb.message.edit_text(txt, reply_markup=profile_kb(prefs), parse_mode="HTML")
@@ -577,8 +519,8 @@ async def on_profile_pick_class(cb: CallbackQuery):
 
 # «📘 Расписание класса»
 async def on_profile_my_open(cb: CallbackQuery):
-    await ensure_links(force=True)
-    dates = _recent_dates(limit=12)
+    await get_links()
+    dates = await _recent_dates(limit=12)
     if not dates:
         await cb.answer("Пока нет доступных дат.", show_alert=True)
         return
@@ -594,7 +536,7 @@ async def on_profile_my_page(cb: CallbackQuery):
         page = int(cb.data.split(":")[-1])
     except Exception:
         page = 0
-    dates = _recent_dates(limit=50)
+    dates = await _recent_dates(limit=50)
     try:
         await cb.message.edit_reply_markup(reply_markup=profile_dates_kb(dates, page=page))
     except Exception:
@@ -604,7 +546,7 @@ async def on_profile_my_page(cb: CallbackQuery):
 
 async def on_profile_my_pick_date(cb: CallbackQuery):
     date = cb.data.split(":", 2)[-1]
-    klass = (prefs_get_user_class(cb.from_user.id) or "").upper().strip()
+    klass = (await prefs_get_user_class(cb.from_user.id) or "").upper().strip()
     if not klass:
         await cb.answer("Сначала выберите класс в профиле.", show_alert=True)
         return
@@ -618,13 +560,12 @@ async def on_profile_my_pick_date(cb: CallbackQuery):
     except Exception as e:
         await cb.answer(f"Лист не найден: {e}", show_alert=True)
         return
-    rows, labels, headers, cab_map = payload
+    labels = payload.labels
     key = klass if klass in labels else next((l for l in labels if l.upper() == klass), None)
     if not key:
         await cb.answer("Ваш класс не найден в листе на эту дату.", show_alert=True)
         return
-    items = collapse_by_time(extract_schedule(rows, labels, headers, key, cab_map.get(key, (None, 0))))
-    text = f"📘 Расписание для {html.escape(key)} на {html.escape(date)}\n\n" + pretty(date, key, items)
+    text = f"📘 Расписание для {html.escape(key)} на {html.escape(date)}\n\n" + payload.html[key]
     try:
         await cb.message.edit_text(text, parse_mode="HTML", disable_web_page_preview=True)
     except Exception:
@@ -639,16 +580,7 @@ async def on_profile_my_pick_date(cb: CallbackQuery):
 
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
-# Кеш: {date: {cab: [(time, klass, subj), ...]}}
-CAB_INDEX: Dict[str, Dict[str, List[Tuple[str, str, Optional[str]]]]] = {}
-
-def _is_physical_cab(cab: Optional[str]) -> bool:
-    if not cab:
-        return False
-    u = cab.upper()
-    if any(x in u for x in ("ОНЛАЙН", "ОФЛАЙН", "ДИСТАНТ")):
-        return False
-    return True
+# Индекс {cab: [(time, klass, subj), ...]} на дату ведёт cabinets.py
 
 # --- группировка по этажам/спортзалам ---
 def _cab_group_key(cab: str) -> str:
@@ -732,98 +664,18 @@ def _kb_cabinets_for_group(date: str, group_key: str, items: List[Tuple[str, int
     b.adjust(*rows)
     return b.as_markup()
 
-def _time_sort_key(t: str) -> Tuple[int, int]:
-    s = (t or "").replace(".", ":")
-    m = re.search(r"(\d{1,2}):(\d{2})", s)
-    if not m:
-        return (99, 99)
-    return (int(m.group(1)), int(m.group(2)))
-
-# --- построение индекса кабинетов с нуля (как сделали ранее) ---
-async def _build_cabinet_index(date: str) -> Dict[str, List[Tuple[str, str, Optional[str]]]]:
-    cached = CAB_INDEX.get(date)
-    if cached:
-        return cached
-
-    g_url = DOC_URL.get(date)
-    if not g_url:
-        link = next((l for l in LINKS if l.date == date), None)
-        if link:
-            try:
-                g_url = await resolve_google_url(link.url)
-                DOC_URL[date] = g_url
-                sched_upsert(date, link.url, g_url)
-            except Exception:
-                g_url = None
-    if not g_url:
-        return {}
-
-    try:
-        gid2title, gids = await sheets_meta(g_url)
-        gid_list = list(gid2title.keys() or gids or [])
-    except Exception:
-        gid_list = []
-
-    out: Dict[str, List[Tuple[str, str, Optional[str]]]] = {}
-
-    # Вытаскиваем пары по всем классам всех вкладок (кабинет ищем «в своей зоне»)
-    from .ensure import ensure_sheet_for_grade
-    from .state import parse_class_label
-    for gid in gid_list:
-        # узнаём номер класса (grade) для вкладки через заголовок
-        title = (gid2title.get(gid) or "").strip()
-        grade = grade_from_label(parse_class_label(title) or "") if title else None
-        if not grade:
-            # fallback: переберём 5..11
-            for g in range(5, 12):
-                try:
-                    _g_url, _gid, payload = await ensure_sheet_for_grade(date, g)
-                except Exception:
-                    continue
-                if _gid == gid:
-                    grade = g
-                    rows, labels, headers, _cab_map_unused = payload
-                    break
-            else:
-                # не нашли — просто пропускаем вкладку
-                continue
-        else:
-            try:
-                _g_url, _gid, payload = await ensure_sheet_for_grade(date, grade)
-            except Exception:
-                continue
-            rows, labels, headers, _cab_map_unused = payload
-
-        for klass in labels:
-            items = extract_schedule_anycab(rows, labels, headers, klass)
-            for t, subj, cab in items:
-                if not _is_physical_cab(cab):
-                    continue
-                # делим "Г3-04/Г4-03" на отдельные кабинеты
-                for cab_one in re.split(r"[\/,;|]+", (cab or "").upper()):
-                    key = cab_one.strip()
-                    if not key or not _is_physical_cab(key):
-                        continue
-                    out.setdefault(key, []).append((t, klass, subj))
-
-    for cab, lst in out.items():
-        lst.sort(key=lambda x: _time_sort_key(x[0]))
-
-    CAB_INDEX[date] = out
-    return out
-
 # --- хендлеры ---
 
 async def on_rooms(m: Message):
     """Кнопка '🏫 Расписание кабинетов' — сначала даты."""
-    upsert_user(m.from_user); log_event(m.from_user.id, "rooms_open")
-    await ensure_links(force=True)
+    await upsert_user(m.from_user); log_event(m.from_user.id, "rooms_open")
+    await get_links()
     if not LINKS:
         return await m.answer("Пока нет дат с расписанием.", reply_markup=MAIN_KB)
     await m.answer("Выберите дату для просмотра расписания кабинетов:", reply_markup=_kb_rooms_dates(LINKS))
 
 async def on_rooms_pick_date(c: CallbackQuery):
-    upsert_user(c.from_user); await ensure_links(force=True)
+    await upsert_user(c.from_user); await get_links()
     try:
         idx = int(c.data.split(":", 1)[1])
     except Exception:
@@ -836,7 +688,7 @@ async def on_rooms_pick_date(c: CallbackQuery):
     loader = await show_loader(c, "Собираю кабинеты…", "⚙️ Строю расписание по кабинетам…")
 
     try:
-        cabmap = await _build_cabinet_index(link.date)
+        cabmap = await cabinet_index(link.date)
     except Exception as e:
         return await replace_loader(loader, f"Не удалось построить список кабинетов: {e}")
 
@@ -849,15 +701,13 @@ async def on_rooms_pick_date(c: CallbackQuery):
 
 async def on_rooms_pick_group(c: CallbackQuery):
     """Выбор группы (этаж/спортзалы)."""
-    upsert_user(c.from_user)
+    await upsert_user(c.from_user)
     try:
         _, date, group_key = c.data.split(":", 2)
     except Exception:
         return await c.answer()
 
-    cabmap = CAB_INDEX.get(date) or {}
-    if not cabmap:
-        cabmap = await _build_cabinet_index(date)
+    cabmap = await cabinet_index(date)
     groups = _group_cabs(cabmap)
     items = groups.get(group_key) or []
     if not items:
@@ -869,15 +719,13 @@ async def on_rooms_pick_group(c: CallbackQuery):
     await c.answer()
 
 async def on_rooms_pick_cabinet(c: CallbackQuery):
-    upsert_user(c.from_user)
+    await upsert_user(c.from_user)
     try:
         _, date, cab = c.data.split(":", 2)
     except Exception:
         return await c.answer()
 
-    cabmap = CAB_INDEX.get(date) or {}
-    if not cabmap:
-        cabmap = await _build_cabinet_index(date)
+    cabmap = await cabinet_index(date)
 
     items = cabmap.get(cab)
     if not items:
@@ -898,24 +746,22 @@ async def on_rooms_pick_cabinet(c: CallbackQuery):
 
 async def on_rooms_back_to_cabs(c: CallbackQuery):
     """Назад со списка кабинетов к этажам."""
-    upsert_user(c.from_user)
+    await upsert_user(c.from_user)
     date = c.data.split(":", 1)[1] if ":" in c.data else None
     if not date:
-        await ensure_links(force=True)
+        await get_links()
         return await c.message.edit_text(
             "Выберите дату для просмотра расписания кабинетов:",
             reply_markup=_kb_rooms_dates(LINKS),
         )
-    cabmap = CAB_INDEX.get(date) or {}
-    if not cabmap:
-        cabmap = await _build_cabinet_index(date)
+    cabmap = await cabinet_index(date)
     groups = _group_cabs(cabmap)
     await c.message.edit_text(f"Этажи на {date}:", reply_markup=_kb_room_groups(date, groups))
     await c.answer()
 async def on_rooms_back_to_dates(c: CallbackQuery):
     """Назад с этажей к выбору дат (чтобы не показывать toast)."""
-    upsert_user(c.from_user)
-    await ensure_links(force=True)
+    await upsert_user(c.from_user)
+    await get_links()
     try:
         await c.message.edit_text(
             "Выберите дату для просмотра расписания кабинетов:",
@@ -937,25 +783,38 @@ def is_admin(uid: int) -> bool:
     return uid == settings.ADMIN_ID
 
 
+TG_TEXT_LIMIT = 4096  # максимум символов в одном сообщении Telegram
+
+
+def split_message(parts: List[str], limit: int = TG_TEXT_LIMIT) -> List[str]:
+    """Склеивает куски в сообщения не длиннее limit, разрезая только между кусками (теги HTML не рвутся)."""
+    out, cur = [], ""
+    for p in parts:
+        if cur and len(cur) + len(p) > limit:
+            out.append(cur.strip())
+            cur = ""
+        # одиночный кусок длиннее лимита (не бывает в /admin) — режем как есть
+        while len(p) > limit:
+            out.append(p[:limit])
+            p = p[limit:]
+        cur += p
+    if cur.strip():
+        out.append(cur.strip())
+    return out
+
+
 async def cmd_admin(m: Message):
     if not is_admin(m.from_user.id):
         return await m.answer("⛔ Доступ запрещён.")
-    upsert_user(m.from_user)
+    await upsert_user(m.from_user)
     try:
-        from .db import DB
         from .utils import fmt_msk
+        summary = await admin_summary()
     except Exception:
         return await m.answer("Админ-панель временно недоступна.")
 
-    tu = DB.execute("SELECT COUNT(*) FROM users").fetchone()[0]
-    te = DB.execute("SELECT COUNT(*) FROM events").fetchone()[0]
-    a24 = DB.execute("SELECT COUNT(DISTINCT user_id) FROM events WHERE ts >= datetime('now','-1 day')").fetchone()[0]
-    top = DB.execute(
-        "SELECT user_id, first_name, username, msg_count, last_seen FROM users ORDER BY msg_count DESC, last_seen DESC LIMIT 10"
-    ).fetchall()
-    last = DB.execute(
-        "SELECT e.ts, e.type, u.user_id, u.username, e.meta FROM events e JOIN users u USING(user_id) ORDER BY e.id DESC LIMIT 10"
-    ).fetchall()
+    tu, te, a24 = summary["users"], summary["events"], summary["active_24h"]
+    top, last = summary["top"], summary["last"]
 
     def ulabel(r):
         uid, fn, un, cnt, ls = r
@@ -965,7 +824,7 @@ async def cmd_admin(m: Message):
     def eline(r):
         ts, et, uid, un, meta = r
         tag = f"@{un}" if un else str(uid)
-        return f"{fmt_msk(ts)} · {et} · {tag} · {meta or ''}"
+        return f"{fmt_msk(ts)} · {html.escape(et)} · {tag} · {html.escape(meta or '')}"
 
     msg = [
         "🛠 <b>Админ-панель</b>",
@@ -975,6 +834,70 @@ async def cmd_admin(m: Message):
         "\n\n🏆 <b>Топ 10 по активности</b>\n",
     ]
     msg += [f"• {ulabel(r)}" for r in top] or ["— нет данных —"]
+    msg += ["\n\n📈 <b>По дням (UTC)</b>\n"]
+    msg += [f"• {d}: активных {u}, событий {e}\n" for d, u, e in summary["days"]] or ["— нет данных —"]
+    msg += ["\n🏷 <b>Типы событий</b>\n"]
+    msg += [f"• {t}: {c}\n" for t, c in summary["types"]] or ["— нет данных —"]
     msg += ["\n\n📝 <b>Последние 10 событий</b>\n"]
     msg += [f"• {eline(r)}" for r in last] or ["— нет данных —"]
-    await m.answer("".join(msg), parse_mode="HTML")
+
+    from .http import pool_stats
+    from .ensure import FLIGHT
+    hs = pool_stats()
+    msg += [
+        "\n\n🌐 <b>HTTP</b>\n",
+        f"• запросов: {hs['requests']}, ошибок: {hs['errors']}\n",
+        f"• соединений: новых {hs['conn_created']}, переиспользовано {hs['conn_reused']}\n",
+        f"• пул: занято {hs['in_use']}, свободно {hs['idle']} ({hs['hosts']} хостов)\n",
+        f"• DNS-кэш: попаданий {hs['dns_hits']}, промахов {hs['dns_misses']}\n",
+        f"• загрузок листов: {FLIGHT.calls}, склеено одновременных: {FLIGHT.coalesced}",
+    ]
+
+    from .scheduler import STATS as SS
+    msg += [
+        "\n\n👀 <b>Наблюдатель</b>\n",
+        f"• заданий: {SS['jobs']}, проверок: {SS['checks']}, изменений: {SS['changes']}, ошибок: {SS['errors']}\n",
+        f"• загрузок: {SS['fetches']}, время проверок: всего {SS['busy']:.0f} c, последняя {SS['last_duration']:.1f} c,"
+        f" самая долгая {SS['max_duration']:.1f} c\n",
+        f"• CSV: 304 — {SS['not_modified']}, скачано {SS['bytes'] // 1024} КБ"
+        + (f", следующая проверка через {SS['next_in']:.0f} c" if SS['next_in'] is not None else ""),
+    ]
+
+    from .leader import STATS as LS
+    msg += [
+        f"\n• реплика {html.escape(LS['holder'])}: {'лидер' if LS['leader'] else 'резерв'}"
+        f" (аренда у {html.escape(LS['current'] or 'нет')}, выборов {LS['elections']}, ошибок {LS['errors']})",
+    ]
+
+    from .broadcast import STATS as BS
+    msg += [
+        "\n\n📣 <b>Рассылка</b>\n",
+        f"• в очереди: {BS['queued']}, отправлено: {BS['sent']}, не доставлено: {BS['failed']}\n",
+        f"• RetryAfter: {BS['retry_after']}, повторов: {BS['retries']}, последняя пачка: {BS['last_batch']} за {BS['last_duration']:.1f} c",
+    ]
+
+    from .db import WRITE_STATS as DW, _WQ
+    msg += [
+        f"\n• запись кликов: в очереди {_WQ.qsize()}, пачек {DW['batches']} (макс. {DW['max_batch']}),"
+        f" событий {DW['events']}, потеряно {DW['dropped']}, ошибок {DW['errors']}",
+    ]
+
+    from .retention import STATS as RS
+    if RS["runs"]:
+        msg += [
+            f"\n• хранение: {fmt_msk(RS['last_run'])}, убрано событий {RS['last_expired']} (всего {RS['expired']}),"
+            f" страниц {RS['pages']}, свободных {RS['freelist']}",
+        ]
+
+    from .cache import CACHES
+    msg += ["\n\n🗄 <b>Кэши</b>\n"]
+    for c in CACHES.values():
+        st = c.stats()
+        msg.append(
+            f"• {st['name']}: {st['entries']} зап., {st['bytes'] / 1024:.0f} КБ"
+            + (f" из {st['max_bytes'] // 1024} КБ" if st['max_bytes'] else "")
+            + f"; hit {st['hits']}, miss {st['misses']}, вытеснено {st['evictions']},"
+            f" истекло {st['expirations']}, сброшено {st['invalidations']}\n"
+        )
+    for chunk in split_message(msg):
+        await m.answer(chunk, parse_mode="HTML")
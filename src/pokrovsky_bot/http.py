@@ -1,32 +1,160 @@
-from typing import Optional
+from typing import Any, Dict, Optional, Tuple
 import aiohttp
 import asyncio
-from .config import HEADERS
+from .config import HEADERS, settings
+
+# Общая HTTP-сессия приложения: создаётся в main при старте и закрывается при остановке.
+# Держит keep-alive соединения по хостам и DNS-кэш, поэтому клики и цикл наблюдателя
+# переиспользуют уже «тёплые» TLS-соединения к gosuslugi.ru и docs.google.com.
+SESSION: Optional[aiohttp.ClientSession] = None
+
+# Счётчики для /admin
+STATS: Dict[str, int] = {
+    "requests": 0,
+    "errors": 0,
+    "conn_created": 0,
+    "conn_reused": 0,
+    "dns_hits": 0,
+    "dns_misses": 0,
+    "bytes": 0,          # тело ответов fetch_conditional
+    "not_modified": 0,   # ответов 304
+}
+
+TIMEOUT = aiohttp.ClientTimeout(total=60, connect=30)  # Увеличили таймауты
+
+
+def _inc(key: str):
+    async def _cb(_session, _ctx, _params):
+        STATS[key] += 1
+    return _cb
+
+
+def _trace_config() -> aiohttp.TraceConfig:
+    tc = aiohttp.TraceConfig()
+    tc.on_request_start.append(_inc("requests"))
+    tc.on_request_exception.append(_inc("errors"))
+    tc.on_connection_create_end.append(_inc("conn_created"))
+    tc.on_connection_reuseconn.append(_inc("conn_reused"))
+    tc.on_dns_cache_hit.append(_inc("dns_hits"))
+    tc.on_dns_cache_miss.append(_inc("dns_misses"))
+    return tc
+
+
+def _make_session() -> aiohttp.ClientSession:
+    connector = aiohttp.TCPConnector(
+        limit=settings.HTTP_LIMIT,
+        limit_per_host=settings.HTTP_LIMIT_PER_HOST,
+        keepalive_timeout=settings.HTTP_KEEPALIVE,
+        use_dns_cache=True,
+        ttl_dns_cache=settings.HTTP_DNS_TTL,
+    )
+    return aiohttp.ClientSession(
+        timeout=TIMEOUT,
+        headers=HEADERS,
+        connector=connector,
+        trace_configs=[_trace_config()],
+    )
+
+
+async def open_session() -> aiohttp.ClientSession:
+    """Создаёт общую сессию (идемпотентно)."""
+    global SESSION
+    if SESSION is None or SESSION.closed:
+        SESSION = _make_session()
+    return SESSION
+
+
+async def close_session():
+    global SESSION
+    if SESSION is not None and not SESSION.closed:
+        await SESSION.close()
+    SESSION = None
+
+
+def pool_stats() -> Dict[str, Any]:
+    """Снимок состояния пула соединений + счётчики переиспользования."""
+    out: Dict[str, Any] = dict(STATS)
+    conn = SESSION.connector if SESSION is not None and not SESSION.closed else None
+    # у TCPConnector нет публичного API для размера пула — смотрим во внутренние поля аккуратно
+    idle = getattr(conn, "_conns", None) or {}
+    acquired = getattr(conn, "_acquired", None) or ()
+    out["open"] = conn is not None
+    out["idle"] = sum(len(v) for v in idle.values())
+    out["in_use"] = len(acquired)
+    out["hosts"] = len(idle)
+    return out
+
+
+async def _get(s: aiohttp.ClientSession, url: str) -> str:
+    async with s.get(url) as r:
+        r.raise_for_status()
+        return await r.text()
+
 
 async def fetch_text(url: str, session: Optional[aiohttp.ClientSession] = None, retries: int = 3) -> str:
-    timeout = aiohttp.ClientTimeout(total=60, connect=30)  # Увеличили таймауты
-    
     for attempt in range(retries):
         try:
-            if session is None:
-                connector = aiohttp.TCPConnector(limit=100, limit_per_host=30)
-                async with aiohttp.ClientSession(
-                    timeout=timeout, 
-                    headers=HEADERS,
-                    connector=connector
-                ) as s:
-                    async with s.get(url) as r:
-                        r.raise_for_status()
-                        return await r.text()
-            else:
-                async with session.get(url) as r:
-                    r.raise_for_status()
-                    return await r.text()
-                    
+            if session is not None:
+                return await _get(session, url)
+            if SESSION is not None and not SESSION.closed:
+                return await _get(SESSION, url)
+            # общая сессия не поднята (скрипты/отладка) — разовая сессия
+            async with _make_session() as s:
+                return await _get(s, url)
+
         except (aiohttp.ClientError, asyncio.TimeoutError) as e:
             if attempt == retries - 1:
                 raise e
             # Ждем перед повторной попыткой
             await asyncio.sleep(2 ** attempt)
-    
+
+    raise Exception(f"Failed to fetch {url} after {retries} attempts")
+
+
+async def _get_conditional(s: aiohttp.ClientSession, url: str, req_headers: Dict[str, str]):
+    async with s.get(url, headers=req_headers) as r:
+        if r.status == 304:
+            return 304, None, r.headers
+        r.raise_for_status()
+        return r.status, await r.read(), r.headers
+
+
+async def fetch_conditional(
+    url: str,
+    etag: Optional[str] = None,
+    last_modified: Optional[str] = None,
+    retries: int = 3,
+) -> Tuple[int, Optional[bytes], Dict[str, Any]]:
+    """
+    Условный GET (If-None-Match / If-Modified-Since).
+    -> (status, body|None при 304, {"etag", "last_modified", "length"}).
+    Тело отдаём байтами: для сравнения хэшей декодировать текст не нужно.
+    """
+    req_headers: Dict[str, str] = {}
+    if etag:
+        req_headers["If-None-Match"] = etag
+    if last_modified:
+        req_headers["If-Modified-Since"] = last_modified
+
+    for attempt in range(retries):
+        try:
+            if SESSION is not None and not SESSION.closed:
+                status, body, h = await _get_conditional(SESSION, url, req_headers)
+            else:
+                async with _make_session() as s:
+                    status, body, h = await _get_conditional(s, url, req_headers)
+            STATS["bytes"] += len(body or b"")
+            if status == 304:
+                STATS["not_modified"] += 1
+            length = h.get("Content-Length")
+            return status, body, {
+                "etag": h.get("ETag") or etag,
+                "last_modified": h.get("Last-Modified") or last_modified,
+                "length": int(length) if length and length.isdigit() else (len(body) if body is not None else None),
+            }
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if attempt == retries - 1:
+                raise e
+            await asyncio.sleep(2 ** attempt)
+
     raise Exception(f"Failed to fetch {url} after {retries} attempts")
@@ -0,0 +1,79 @@
+import asyncio
+import os
+import socket
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict
+
+from .config import settings
+from .db import lease_acquire, lease_release
+
+# Несколько реплик бота отвечают на апдейты все, а наблюдатель, рассылку и чистку ведёт одна —
+# держатель аренды "leader" в общей БД. Аренда продлевается каждые LEADER_LEASE_TTL/3 секунд;
+# если лидер пропал, другая реплика забирает её не позже чем через LEADER_LEASE_TTL + период продления.
+# Лидер, не сумевший продлить аренду до её истечения, сам останавливает фоновые задачи.
+# Аренда пишется на отдельном соединении (db.py), мимо общей очереди писателя. Остальные реплики
+# сбрасывают устаревшие листы по версиям, которые лидер пишет в sheet_hashes (watcher.follow_loop).
+
+LEASE = "leader"
+HOLDER = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+# Сводка для /admin и /healthz
+STATS: Dict[str, Any] = {
+    "holder": HOLDER,
+    "leader": False,
+    "current": None,  # кто держит аренду по последнему опросу
+    "since": None,
+    "elections": 0,
+    "errors": 0,
+}
+
+
+async def leader_loop(on_elected: Callable[[], None], on_demoted: Callable[[], Awaitable[None]]) -> None:
+    """
+    on_elected() — запустить фоновые задачи, await on_demoted() — остановить их.
+    При отмене (остановке процесса) аренда отдаётся сразу.
+    """
+    ttl = max(settings.LEADER_LEASE_TTL, 3.0)
+    renew = ttl / 3
+    valid_until = 0.0  # по monotonic: до какого момента аренда точно наша
+
+    async def step_down():
+        if STATS["leader"]:
+            STATS["leader"] = False
+            STATS["since"] = None
+            print(f"[leader] {HOLDER}: роль лидера потеряна")
+            await on_demoted()
+
+    try:
+        while True:
+            t0 = time.monotonic()
+            try:
+                # ответ, пришедший позже периода, не считаем: к тому времени аренда могла уйти
+                holder, _ = await asyncio.wait_for(lease_acquire(LEASE, HOLDER, ttl), timeout=renew)
+                STATS["current"] = holder
+                if holder == HOLDER:
+                    valid_until = t0 + ttl
+                    if not STATS["leader"]:
+                        STATS["leader"] = True
+                        STATS["since"] = time.time()
+                        STATS["elections"] += 1
+                        print(f"[leader] {HOLDER}: стал лидером")
+                        on_elected()
+                else:
+                    await step_down()
+            except Exception as e:
+                STATS["errors"] += 1
+                print(f"[leader] {e!r}")
+                # до следующей попытки аренда истечёт — уступаем заранее
+                if time.monotonic() + renew >= valid_until:
+                    await step_down()
+            await asyncio.sleep(renew)
+    finally:
+        was_leader = STATS["leader"]
+        await step_down()
+        if was_leader:
+            try:
+                await lease_release(LEASE, HOLDER)
+            except Exception as e:
+                print(f"[leader] {e}")
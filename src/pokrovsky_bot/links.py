@@ -0,0 +1,63 @@
+import asyncio
+import time
+from typing import List, Set
+
+from .config import settings
+from .models import SLink
+from .singleflight import SingleFlight
+from .site import get_links_from_site
+from .state import LINKS
+
+# Кэш списка дат со страницы школы (stale-while-revalidate):
+# отдаём последний удачный список сразу, а устаревший обновляем в фоне.
+_FETCHED_AT = 0.0
+_FLIGHT = SingleFlight()
+_BG: Set[asyncio.Task] = set()
+
+
+def _store(links: List[SLink]):
+    global _FETCHED_AT
+    LINKS[:] = links
+    _FETCHED_AT = time.monotonic()
+
+
+def push_links(links: List[SLink]):
+    """Наблюдатель кладёт сюда свежий список, как только его получил."""
+    if links:
+        _store(list(links))
+
+
+async def _refresh() -> List[SLink]:
+    fresh = await get_links_from_site()
+    # пустой список = сайт недоступен/сломан; держим последний удачный
+    if fresh:
+        _store(fresh)
+    return LINKS
+
+
+async def refresh_links() -> List[SLink]:
+    return await _FLIGHT.do("links", _refresh)
+
+
+def _refresh_in_background():
+    if _FLIGHT.busy("links"):
+        return
+    t = asyncio.create_task(refresh_links())
+    _BG.add(t)
+    t.add_done_callback(_BG.discard)
+
+
+def is_stale() -> bool:
+    return (time.monotonic() - _FETCHED_AT) >= settings.LINKS_TTL
+
+
+async def get_links(wait: bool = False) -> List[SLink]:
+    """
+    Возвращает список дат. Ждём сеть только если кэш пуст (или wait=True),
+    иначе — мгновенно, с фоновым обновлением устаревшего кэша.
+    """
+    if wait or not LINKS:
+        return await refresh_links()
+    if is_stale():
+        _refresh_in_background()
+    return LINKS
@@ -1,17 +1,126 @@
 import asyncio
+from typing import Dict
+
+from aiogram import Bot, Dispatcher
+from aiohttp import web
+
 from .bot import build_bot_dp
-from .watcher import watch_loop
+from .config import settings
+from .http import open_session, close_session
+from .db import stop_writer
+from .watcher import follow_loop, watch_loop
+from .broadcast import broadcast_loop
+from .retention import retention_loop
+from .leader import STATS as LEADER, leader_loop
 
+# Фоновые задачи процесса: имя -> задача (для /healthz и корректной остановки).
+# "leader" и "follow" есть всегда; watcher/broadcast/retention — только пока эта реплика лидер.
+TASKS: Dict[str, asyncio.Task] = {}
+_WORKERS = ("watcher", "broadcast", "retention")
 
-def main():
-    bot, dp = build_bot_dp()
 
-    async def run():
-        import asyncio as _asyncio
-        _asyncio.create_task(watch_loop(bot))
+def _start_workers(bot: Bot) -> None:
+    TASKS["watcher"] = asyncio.create_task(watch_loop())
+    TASKS["broadcast"] = asyncio.create_task(broadcast_loop(bot))
+    TASKS["retention"] = asyncio.create_task(retention_loop())
+
+
+async def _stop_workers() -> None:
+    tasks = [TASKS.pop(name) for name in _WORKERS if name in TASKS]
+    for t in tasks:
+        t.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def start_background(bot: Bot) -> None:
+    TASKS["leader"] = asyncio.create_task(leader_loop(lambda: _start_workers(bot), _stop_workers))
+    TASKS["follow"] = asyncio.create_task(follow_loop(lambda: LEADER["leader"]))
+
+
+async def stop_background() -> None:
+    # сначала лидерство: оно останавливает свои задачи и отдаёт аренду
+    leader = TASKS.pop("leader", None)
+    if leader is not None:
+        leader.cancel()
+        await asyncio.gather(leader, return_exceptions=True)
+    follow = TASKS.pop("follow", None)
+    if follow is not None:
+        follow.cancel()
+        await asyncio.gather(follow, return_exceptions=True)
+    await _stop_workers()
+
+
+async def health(_request: web.Request) -> web.Response:
+    tasks = {name: not t.done() for name, t in TASKS.items()}
+    ok = all(tasks.values())
+    return web.json_response(
+        {"ok": ok, "mode": "webhook", "leader": LEADER["leader"], "tasks": tasks},
+        status=200 if ok else 503,
+    )
+
+
+def build_webhook_app(bot: Bot, dp: Dispatcher) -> web.Application:
+    """
+    aiohttp-приложение для режима webhook. Апдейты обрабатываются в фоне (Telegram сразу получает 200),
+    заголовок X-Telegram-Bot-Api-Secret-Token сверяется с WEBHOOK_SECRET (обязателен).
+    """
+    from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+    if not settings.WEBHOOK_SECRET:
+        # без секрета апдейт от имени Telegram может прислать кто угодно, знающий адрес
+        raise SystemExit("Для RUN_MODE=webhook задайте WEBHOOK_SECRET (см. .env).")
+
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=settings.WEBHOOK_SECRET,
+        handle_in_background=True,
+    ).register(app, path=settings.WEBHOOK_PATH)
+    app.router.add_get("/healthz", health)
+
+    async def on_startup(_app: web.Application):
+        await open_session()
+        start_background(bot)
+        if settings.WEBHOOK_URL:
+            await bot.set_webhook(
+                settings.WEBHOOK_URL.rstrip("/") + settings.WEBHOOK_PATH,
+                secret_token=settings.WEBHOOK_SECRET,
+                allowed_updates=dp.resolve_used_update_types(),
+            )
+
+    async def on_shutdown(_app: web.Application):
+        # вебхук не снимаем: при перезапуске/нескольких репликах Telegram продолжит слать апдейты
+        await stop_background()
+        await close_session()
+        stop_writer()
+
+    app.on_startup.append(on_startup)
+    app.on_shutdown.append(on_shutdown)
+    # startup/shutdown диспетчера (команды бота) и закрытие сессии бота
+    setup_application(app, dp, bot=bot)
+    return app
+
+
+async def run_polling(bot: Bot, dp: Dispatcher) -> None:
+    await open_session()
+    try:
+        start_background(bot)
+        await bot.delete_webhook(drop_pending_updates=False)
         await dp.start_polling(bot)
+    finally:
+        await stop_background()
+        await close_session()
+        stop_writer()
+
+
+def main():
+    bot, dp = build_bot_dp()
 
-    asyncio.run(run())
+    if settings.RUN_MODE == "webhook":
+        web.run_app(build_webhook_app(bot, dp), host=settings.WEBHOOK_HOST, port=settings.WEBHOOK_PORT)
+    else:
+        asyncio.run(run_polling(bot, dp))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,195 @@
+import sqlite3
+from typing import Callable, List, Tuple, Union
+
+# Версии схемы. Каждая миграция — отдельная транзакция (BEGIN IMMEDIATE … COMMIT) вместе с записью
+# в schema_version: либо применилась целиком, либо нет. Новые изменения — только новой версией в конец списка,
+# уже выпущенные шаги не правим. Шаги первых версий идемпотентны (IF NOT EXISTS): базы, созданные до
+# появления schema_version, проходят их без изменений.
+
+Step = Union[str, Callable[[sqlite3.Connection], None]]
+
+
+def _columns(con: sqlite3.Connection, table: str) -> List[str]:
+    return [r[1] for r in con.execute(f"PRAGMA table_info({table})")]
+
+
+def add_column(table: str, column: str, decl: str) -> Callable[[sqlite3.Connection], None]:
+    """ALTER TABLE … ADD COLUMN, если колонки ещё нет (ADD COLUMN в SQLite не переписывает таблицу)."""
+    def step(con: sqlite3.Connection):
+        if column not in _columns(con, table):
+            con.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+    return step
+
+
+def _rollup_backfill(con: sqlite3.Connection):
+    """Сводки stats_* по уже накопленной истории (один раз, при появлении таблиц)."""
+    if con.execute("SELECT 1 FROM stats_totals LIMIT 1").fetchone():
+        return
+    con.execute("INSERT INTO stats_totals(key, value) SELECT 'users', COUNT(*) FROM users")
+    con.execute("INSERT INTO stats_totals(key, value) SELECT 'events', COUNT(*) FROM events")
+    con.execute("INSERT INTO stats_daily(day, events) SELECT substr(ts,1,10), COUNT(*) FROM events GROUP BY 1")
+    con.execute("INSERT INTO stats_hourly(hour, events) SELECT substr(ts,1,13), COUNT(*) FROM events GROUP BY 1")
+    con.execute("INSERT INTO stats_event_types(type, count) SELECT type, COUNT(*) FROM events GROUP BY 1")
+    con.execute(
+        "INSERT OR IGNORE INTO stats_daily_users(day, user_id) "
+        "SELECT DISTINCT substr(ts,1,10), user_id FROM events WHERE substr(type,1,7) != 'notify_'"
+    )
+    con.execute("UPDATE stats_daily SET users=(SELECT COUNT(*) FROM stats_daily_users d WHERE d.day=stats_daily.day)")
+
+
+MIGRATIONS: List[Tuple[int, str, List[Step]]] = [
+    (1, "baseline", [
+        """CREATE TABLE IF NOT EXISTS users(
+          user_id INTEGER PRIMARY KEY, first_name TEXT, username TEXT,
+          joined_at TEXT, last_seen TEXT, msg_count INTEGER DEFAULT 0)""",
+        """CREATE TABLE IF NOT EXISTS events(
+          id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL,
+          ts TEXT NOT NULL, type TEXT NOT NULL, meta TEXT,
+          FOREIGN KEY(user_id) REFERENCES users(user_id))""",
+        # список известных расписаний (по датам)
+        """CREATE TABLE IF NOT EXISTS schedules(
+          date_label TEXT PRIMARY KEY,         -- '08.09'
+          link_url   TEXT NOT NULL,
+          google_url TEXT,
+          created_at TEXT NOT NULL)""",
+        # хэши листов (чтобы видеть правки)
+        """CREATE TABLE IF NOT EXISTS sheet_hashes(
+          date_label TEXT NOT NULL,
+          gid        TEXT NOT NULL,
+          title      TEXT,
+          hash       TEXT NOT NULL,
+          updated_at TEXT NOT NULL,
+          PRIMARY KEY(date_label, gid))""",
+        # настройки пользователей (личный кабинет)
+        """CREATE TABLE IF NOT EXISTS user_prefs(
+          user_id       INTEGER PRIMARY KEY,
+          notify_new    INTEGER NOT NULL DEFAULT 1,
+          notify_change INTEGER NOT NULL DEFAULT 1,
+          klass         TEXT,
+          updated_at    TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%S', 'now')))""",
+        # таблица могла быть создана без этих колонок — добавляем недостающие
+        add_column("user_prefs", "notify_change", "INTEGER NOT NULL DEFAULT 1"),
+        add_column("user_prefs", "klass", "TEXT"),
+        add_column("user_prefs", "updated_at", "TEXT"),
+    ]),
+    (2, "http_validators", [
+        # валидаторы условных запросов (ETag / Last-Modified) по URL выгрузок
+        """CREATE TABLE IF NOT EXISTS http_validators(
+          url           TEXT PRIMARY KEY,
+          etag          TEXT,
+          last_modified TEXT,
+          length        INTEGER,
+          digest        TEXT,
+          updated_at    TEXT NOT NULL)""",
+    ]),
+    (3, "outbox", [
+        # очередь исходящих уведомлений (переживает перезапуск: недоставленное дошлётся)
+        """CREATE TABLE IF NOT EXISTS outbox(
+          id         INTEGER PRIMARY KEY AUTOINCREMENT,
+          user_id    INTEGER NOT NULL,
+          text       TEXT NOT NULL,
+          event      TEXT NOT NULL,              -- префикс события для events: notify_new / notify_change
+          meta       TEXT,
+          status     INTEGER NOT NULL DEFAULT 0, -- 0 ждёт, 2 не доставлено (доставленные удаляются)
+          attempts   INTEGER NOT NULL DEFAULT 0,
+          error      TEXT,
+          created_at TEXT NOT NULL)""",
+        "CREATE INDEX IF NOT EXISTS idx_outbox_status ON outbox(status, id)",
+    ]),
+    # индексы под /admin и чистку истории — каждый своей транзакцией, чтобы не держать запись долго
+    (4, "idx_events_ts", ["CREATE INDEX IF NOT EXISTS idx_events_ts ON events(ts)"]),
+    (5, "idx_users_activity", [
+        "CREATE INDEX IF NOT EXISTS idx_users_activity ON users(msg_count DESC, last_seen DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_users_last_seen ON users(last_seen)",
+    ]),
+    (6, "rollups", [
+        # сводки, которые ведутся вместе с записью событий (/admin не сканирует events)
+        """CREATE TABLE IF NOT EXISTS stats_totals(
+          key   TEXT PRIMARY KEY,              -- 'users' | 'events'
+          value INTEGER NOT NULL DEFAULT 0)""",
+        """CREATE TABLE IF NOT EXISTS stats_daily(
+          day    TEXT PRIMARY KEY,             -- 'YYYY-MM-DD' (UTC)
+          users  INTEGER NOT NULL DEFAULT 0,   -- активных пользователей за день
+          events INTEGER NOT NULL DEFAULT 0)""",
+        """CREATE TABLE IF NOT EXISTS stats_daily_users(
+          day     TEXT NOT NULL,
+          user_id INTEGER NOT NULL,
+          PRIMARY KEY(day, user_id)) WITHOUT ROWID""",
+        """CREATE TABLE IF NOT EXISTS stats_hourly(
+          hour   TEXT PRIMARY KEY,             -- 'YYYY-MM-DDTHH' (UTC)
+          events INTEGER NOT NULL DEFAULT 0)""",
+        """CREATE TABLE IF NOT EXISTS stats_event_types(
+          type  TEXT PRIMARY KEY,
+          count INTEGER NOT NULL DEFAULT 0)""",
+        _rollup_backfill,
+    ]),
+    (7, "leases", [
+        # аренда ролей между репликами: кто сейчас ведёт наблюдатель/рассылку (см. leader.py)
+        """CREATE TABLE IF NOT EXISTS leases(
+          name        TEXT PRIMARY KEY,
+          holder      TEXT NOT NULL,           -- host:pid:случайный суффикс
+          expires_at  REAL NOT NULL,           -- unix time
+          acquired_at REAL NOT NULL)""",
+    ]),
+    (8, "sheet_catalog", [
+        # какие параллели на какой вкладке таблицы (по разобранным листам): ищем вкладку без перебора
+        """CREATE TABLE IF NOT EXISTS sheet_catalog(
+          doc_id     TEXT NOT NULL,            -- id Google-таблицы
+          gid        TEXT NOT NULL,
+          grade      INTEGER NOT NULL,
+          labels     TEXT NOT NULL,            -- классы параллели на вкладке через запятую
+          digest     TEXT NOT NULL,            -- sha256 CSV, по которому записано
+          updated_at TEXT NOT NULL,
+          PRIMARY KEY(doc_id, gid, grade))""",
+        "CREATE INDEX IF NOT EXISTS idx_sheet_catalog_grade ON sheet_catalog(grade, updated_at)",
+    ]),
+]
+
+
+def schema_version(con: sqlite3.Connection) -> int:
+    row = con.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+
+def migrate(con: sqlite3.Connection) -> List[int]:
+    """Применяет недостающие миграции по порядку. -> список применённых версий."""
+    con.execute(
+        "CREATE TABLE IF NOT EXISTS schema_version("
+        "version INTEGER PRIMARY KEY, name TEXT NOT NULL, applied_at TEXT NOT NULL)"
+    )
+    con.commit()
+    current = schema_version(con)
+    latest = MIGRATIONS[-1][0]
+    if current > latest:
+        raise RuntimeError(f"Схема БД версии {current} новее кода ({latest}) — обновите бота.")
+
+    applied = []
+    for version, name, steps in MIGRATIONS:
+        if version <= current:
+            continue
+        # IMMEDIATE: сразу берём блокировку записи, чтобы не упасть посреди шага на конкурирующей записи
+        con.execute("BEGIN IMMEDIATE")
+        # другой процесс мог применить эту версию, пока мы ждали блокировку — перечитываем под ней
+        if con.execute("SELECT 1 FROM schema_version WHERE version=?", (version,)).fetchone():
+            con.execute("COMMIT")
+            continue
+        try:
+            for step in steps:
+                if callable(step):
+                    step(con)
+                else:
+                    con.execute(step)
+            con.execute(
+                "INSERT INTO schema_version(version, name, applied_at) "
+                "VALUES (?, ?, strftime('%Y-%m-%dT%H:%M:%S+00:00', 'now'))",
+                (version, name),
+            )
+            con.execute("COMMIT")
+        except Exception:
+            con.execute("ROLLBACK")
+            raise
+        applied.append(version)
+        print(f"[db] миграция {version} ({name}) применена")
+    if applied:
+        con.execute("PRAGMA optimize")
+    return applied
@@ -1,7 +1,43 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
 
 @dataclass
 class SLink:
     title: str
     url: str
     date: str
+
+
+@dataclass
+class SheetData:
+    """
+    Загруженный лист (date, gid) одной версии (digest — sha256 CSV).
+    lessons/html посчитаны сразу для всех классов листа при загрузке.
+    Распаковывается как старый кортеж: rows, labels, headers, cab_map = sheet.
+    """
+    rows: Any
+    labels: Dict[str, Tuple[int, int, int]]
+    headers: List[int]
+    cab_map: Dict[str, Tuple[Optional[int], int]]
+    digest: str = ""
+    lessons: Dict[str, List[tuple]] = field(default_factory=dict)
+    html: Dict[str, str] = field(default_factory=dict)
+    nbytes: int = 0
+
+    def __iter__(self):
+        return iter((self.rows, self.labels, self.headers, self.cab_map))
+
+    def __getitem__(self, i):
+        return (self.rows, self.labels, self.headers, self.cab_map)[i]
+
+
+@dataclass
+class CabIndex:
+    """
+    Индекс кабинетов на дату. parts — вклад каждой вкладки: gid -> (digest листа, {кабинет: пары}),
+    cabs — слитый вид {кабинет: [(time, klass, subj), ...]} по времени.
+    При правке вкладки пересчитывается только её вклад и затронутые кабинеты.
+    """
+    parts: Dict[str, Tuple[str, Dict[str, List[tuple]]]] = field(default_factory=dict)
+    cabs: Dict[str, List[tuple]] = field(default_factory=dict)
+    nbytes: int = 0
@@ -1,71 +1,84 @@
-from typing import Optional
-from aiogram import Bot
+import html
+from typing import Dict, List, Optional, Tuple
 
 from .db import (
-    prefs_users_for_new,
-    prefs_users_for_changes,
-    prefs_get_user_class,
-    log_event,
+    prefs_users_for_new_with_class,
+    prefs_users_for_changes_with_class,
+    log_events_many,
 )
-from .parser import grade_from_label, collapse_by_time, extract_schedule, pretty
+from .parser import grade_from_label
 from .ensure import ensure_sheet_for_grade
+from .diff import LessonChange, render_changes
+from .broadcast import enqueue
 
 
-async def notify_new_schedule(bot: Bot, date_label: str) -> None:
+def group_by_class(rows: List[Tuple[int, Optional[str]]]) -> Dict[str, List[int]]:
+    """[(user_id, класс)] -> {КЛАСС: [user_id, ...]}; пустой класс — ключ ""."""
+    out: Dict[str, List[int]] = {}
+    for uid, klass in rows:
+        out.setdefault((klass or "").upper().strip(), []).append(uid)
+    return out
+
+
+async def notify_new_schedule(date_label: str) -> None:
     """
     Рассылает пользователям новое расписание, учитывая их выбранный класс и настройку 'notify_new'.
-    Вычисляет нужный лист через ensure_sheet_for_grade() по номеру класса.
+    Получатели группируются по классу: лист и текст готовятся один раз на класс, а не на пользователя.
     """
-    user_ids = prefs_users_for_new()
-    for uid in user_ids:
-        klass = (prefs_get_user_class(uid) or "").upper().strip()
-        if not klass:
-            continue
-        grade = grade_from_label(klass)
+    out = []
+    for klass, uids in group_by_class(await prefs_users_for_new_with_class()).items():
+        grade = grade_from_label(klass) if klass else None
         if grade is None:
             continue
 
         try:
             # Получаем лист (payload) для указанного класса/параллели в выбранную дату
             _g_url, gid, payload = await ensure_sheet_for_grade(date_label, grade)
-            rows, labels, headers, cab_map = payload
+            labels = payload.labels
 
             # Если в листе нет точного ключа — пробуем кейс-инсенситив
             key = klass if klass in labels else next((l for l in labels if l.upper() == klass), None)
             if not key:
                 # нет такого класса на листе — пропускаем
-                log_event(uid, "notify_new_skip_no_class", f"{date_label}|{klass}")
+                log_events_many([(uid, "notify_new_skip_no_class", f"{date_label}|{klass}") for uid in uids])
                 continue
 
-            items = collapse_by_time(
-                extract_schedule(rows, labels, headers, key, cab_map.get(key, (None, 0)))
-            )
-            text = f"🆕 Новое расписание на {date_label}\n\n" + pretty(date_label, key, items)
-            await bot.send_message(uid, text, parse_mode="HTML", disable_web_page_preview=True)
-            log_event(uid, "notify_new_sent", f"{date_label}|{key}")
+            text = f"🆕 Новое расписание на {date_label}\n\n" + payload.html[key]
+            out += [(uid, text, "notify_new", f"{date_label}|{key}") for uid in uids]
         except Exception as e:
-            # логируем и продолжаем рассылку остальным
+            # логируем и продолжаем рассылку остальным классам
             try:
-                log_event(uid, "notify_new_error", f"{date_label}|{klass}|{e}")
+                log_events_many([(uid, "notify_new_error", f"{date_label}|{klass}|{e}") for uid in uids])
             except Exception:
                 pass
+    # отправит broadcast_loop с учётом лимитов Telegram
+    await enqueue(out)
 
 
-async def notify_schedule_changes(bot: Bot, date_label: str, diff_text: str) -> None:
+async def notify_class_changes(
+    date_label: str,
+    changes: Dict[str, List[LessonChange]],
+    generic_text: str,
+    sheet_labels: Optional[List[str]] = None,
+) -> None:
     """
-    Рассылает пользователям уведомление об изменениях расписания, учитывая 'notify_change'.
-    Ожидает уже подготовленный текст diff_text (как у тебя в админ-уведомлении).
+    Изменения по классам: каждому пользователю — только его класс.
+    changes пуст (нет прежней версии листа) — короткое уведомление тем, чей класс есть на листе.
+    Не разобрались ни в изменениях, ни в классах листа (новая версия не парсится) — короткое
+    уведомление всем подписанным на изменения.
+    Пользователи без выбранного класса получают общее уведомление о листе, как раньше.
     """
-    for uid in prefs_users_for_changes():
-        try:
-            await bot.send_message(
-                uid,
-                f"✏️ Обновления в расписании на {date_label}\n\n{diff_text}",
-                disable_web_page_preview=True,
-            )
-            log_event(uid, "notify_change_sent", date_label)
-        except Exception as e:
-            try:
-                log_event(uid, "notify_change_error", f"{date_label}|{e}")
-            except Exception:
-                pass
+    generic = html.escape(f"✏️ Обновления в расписании на {date_label}\n\n{generic_text}")
+    by_label = {k.upper(): k for k in changes}
+    on_sheet = {str(l).upper() for l in (sheet_labels or [])}
+    per_class = bool(changes or on_sheet)
+    out = []
+    for k, uids in group_by_class(await prefs_users_for_changes_with_class()).items():
+        if not k or not per_class or (not changes and k in on_sheet):
+            text = generic
+        elif k in by_label:
+            text = render_changes(date_label, by_label[k], changes[by_label[k]])
+        else:
+            continue
+        out += [(uid, text, "notify_change", f"{date_label}|{k}") for uid in uids]
+    await enqueue(out)
@@ -0,0 +1,65 @@
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict
+
+from .config import settings
+from .db import events_expire_batch, maintenance, now_utc, outbox_prune
+
+# Сырые события старше EVENTS_KEEP_DAYS уходят в помесячные файлы (или удаляются) пачками:
+# каждая пачка — отдельная короткая транзакция писателя, клики между ними не ждут.
+# Счётчики для /admin ведутся в stats_* при вставке, поэтому статистика за всё время сохраняется.
+
+OUTBOX_KEEP_DAYS = 30
+VACUUM_PAGES = 2000  # страниц за один проход incremental_vacuum
+
+# Сводка для /admin
+STATS: Dict[str, Any] = {
+    "runs": 0,
+    "last_run": None,
+    "last_duration": 0.0,
+    "expired": 0,
+    "last_expired": 0,
+    "outbox_pruned": 0,
+    "freelist": 0,
+    "pages": 0,
+}
+
+
+def _iso_days_ago(days: float) -> str:
+    return (datetime.now(timezone.utc) - timedelta(days=days)).replace(microsecond=0).isoformat()
+
+
+async def run_retention() -> None:
+    t0 = time.monotonic()
+    moved = 0
+    if settings.EVENTS_KEEP_DAYS > 0:
+        before = _iso_days_ago(settings.EVENTS_KEEP_DAYS)
+        while True:
+            n = await events_expire_batch(before, settings.RETENTION_BATCH, settings.EVENTS_ARCHIVE)
+            moved += n
+            if not n:
+                break
+            await asyncio.sleep(0.05)  # пропускаем вперёд ожидающие записи
+    STATS["outbox_pruned"] += await outbox_prune(_iso_days_ago(OUTBOX_KEEP_DAYS))
+    info = await maintenance(VACUUM_PAGES)
+
+    STATS["runs"] += 1
+    STATS["last_run"] = now_utc()
+    STATS["last_duration"] = time.monotonic() - t0
+    STATS["expired"] += moved
+    STATS["last_expired"] = moved
+    STATS["freelist"] = info.get("freelist", 0)
+    STATS["pages"] = info.get("pages", 0)
+    if moved:
+        print(f"[retention] событий убрано: {moved} за {STATS['last_duration']:.1f} c")
+
+
+async def retention_loop() -> None:
+    await asyncio.sleep(60)  # не мешаем старту
+    while True:
+        try:
+            await run_retention()
+        except Exception as e:
+            print(f"[retention] {e}")
+        await asyncio.sleep(settings.RETENTION_INTERVAL)
@@ -0,0 +1,230 @@
+import asyncio
+import heapq
+import random
+import time
+from dataclasses import dataclass
+from datetime import date as Date, datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from .config import MSK, settings
+from .db import sched_get_all, now_utc
+from .utils import date_from_label
+from . import watcher
+
+# Ключи заданий: ("site",) — страница с датами, ("meta", date) — состав вкладок,
+# ("sheet", date, gid) — сам лист.
+Key = Tuple[str, ...]
+
+FACTOR_MIN, FACTOR_MAX = 0.25, 4.0
+
+# Сводка для /admin
+STATS: Dict[str, Any] = {
+    "started": None,
+    "jobs": 0,
+    "checks": 0,
+    "fetches": 0,       # HTTP-запросов (страница школы, htmlview, CSV)
+    "busy": 0.0,        # суммарное время заданий, с
+    "last_duration": 0.0,
+    "max_duration": 0.0,
+    "changes": 0,
+    "errors": 0,
+    "not_modified": 0,
+    "bytes": 0,
+    "next_in": None,
+}
+
+
+@dataclass
+class Job:
+    key: Key
+    factor: float = 1.0      # <1 — лист часто меняется (опрашиваем чаще), >1 — стабилен
+    errors: int = 0          # подряд идущие ошибки — экспоненциальный бэкофф
+    seq: int = 0             # номер актуальной записи в куче (старые записи пропускаются)
+    g_url: Optional[str] = None
+    title: str = ""
+
+
+def tod_factor(now: datetime) -> float:
+    """Время суток (МСК): ночью правок нет, утром перед уроками — самые частые."""
+    h = now.hour
+    if h < 6:
+        return 4.0
+    if h < 9:
+        return 0.5
+    if h >= 22:
+        return 2.0
+    return 1.0
+
+
+def base_interval(key: Key, today: Date) -> float:
+    if key[0] == "site":
+        return settings.WATCH_SITE_INTERVAL
+    d = date_from_label(key[1], today)
+    delta = (d - today).days if d else 2
+    if delta in (0, 1):
+        base = settings.WATCH_HOT_INTERVAL      # сегодня/завтра
+    elif delta > 1:
+        base = settings.WATCH_WARM_INTERVAL     # будущие
+    else:
+        base = settings.WATCH_COLD_INTERVAL     # прошедшие
+    if key[0] == "meta":
+        base *= 5  # состав вкладок меняется редко
+    return base
+
+
+def next_interval(job: Job, now: datetime) -> float:
+    base = base_interval(job.key, now.date())
+    if job.errors:
+        iv = base * (2 ** min(job.errors, 6))
+    else:
+        iv = base * job.factor * tod_factor(now)
+    iv = min(max(iv, settings.WATCH_MIN_INTERVAL), settings.WATCH_MAX_INTERVAL)
+    return iv * random.uniform(0.9, 1.1)  # разносим проверки во времени
+
+
+class PollScheduler:
+    """
+    Очередь с приоритетом (время следующей проверки) по заданиям site/meta/sheet.
+    Интервал листа зависит от близости даты, времени суток, частоты изменений и ошибок.
+    """
+
+    def __init__(self) -> None:
+        self.jobs: Dict[Key, Job] = {}
+        self._heap: List[Tuple[float, int, Key]] = []
+        self._seq = 0
+        self._sem = asyncio.Semaphore(settings.WATCH_CONCURRENCY)
+        self._running: Set[asyncio.Task] = set()
+        self._wake = asyncio.Event()
+
+    # --- очередь ---
+    def _schedule(self, job: Job, delay: float) -> None:
+        self._seq += 1
+        job.seq = self._seq
+        heapq.heappush(self._heap, (time.monotonic() + delay, self._seq, job.key))
+        self._wake.set()
+
+    def add(self, job: Job, delay: float = 0.0) -> Job:
+        cur = self.jobs.get(job.key)
+        if cur is not None:
+            return cur
+        self.jobs[job.key] = job
+        self._schedule(job, delay)
+        return job
+
+    def drop(self, key: Key) -> None:
+        # запись в куче остаётся, но будет пропущена при извлечении
+        self.jobs.pop(key, None)
+
+    def _drop_date(self, date: str) -> None:
+        for key in [k for k in self.jobs if k[0] != "site" and k[1] == date]:
+            self.drop(key)
+
+    # --- задания ---
+    async def _run_site(self, job: Job) -> None:
+        ok = await watcher.discover_dates()
+        job.errors = 0 if ok else job.errors + 1
+        active = watcher.active_dates(await sched_get_all())
+        for date in active:
+            self.add(Job(("meta", date)))
+        for key in [k for k in self.jobs if k[0] == "meta" and k[1] not in active]:
+            self._drop_date(key[1])
+
+    async def _run_meta(self, job: Job, cycle: Dict[str, int]) -> None:
+        date = job.key[1]
+        known = watcher.active_dates(await sched_get_all()).get(date)
+        if not known:
+            self._drop_date(date)
+            return
+        link_url, g_url = known
+        meta = await watcher.date_meta(date, link_url, g_url, self._sem, cycle)
+        if meta is None:
+            job.errors += 1
+            return
+        job.errors = 0
+        g_url, gid2title, gids = meta
+        for gid in gids:
+            sj = self.add(Job(("sheet", date, gid)))
+            sj.g_url, sj.title = g_url, gid2title.get(gid, "")
+        for key in [k for k in self.jobs if k[0] == "sheet" and k[1] == date and k[2] not in gids]:
+            self.drop(key)
+
+    async def _run_sheet(self, job: Job, cycle: Dict[str, int]) -> None:
+        _kind, date, gid = job.key
+        res = await watcher.check_gid(date, job.g_url, gid, job.title, self._sem, cycle)
+        if res == "error":
+            job.errors += 1
+            return
+        job.errors = 0
+        if res == "changed":
+            job.factor = max(FACTOR_MIN, job.factor * 0.5)
+        else:
+            job.factor = min(FACTOR_MAX, job.factor * 1.25)
+
+    async def _run(self, job: Job) -> None:
+        cycle = watcher.new_cycle()
+        t0 = time.monotonic()
+        try:
+            kind = job.key[0]
+            if kind == "site":
+                cycle["fetches"] += 1
+                await self._run_site(job)
+            elif kind == "meta":
+                await self._run_meta(job, cycle)
+            else:
+                await self._run_sheet(job, cycle)
+        except Exception as e:
+            job.errors += 1
+            print(f"[scheduler] {job.key}: {e}")
+        finally:
+            took = time.monotonic() - t0
+            STATS["checks"] += 1
+            STATS["busy"] += took
+            STATS["last_duration"] = took
+            STATS["max_duration"] = max(STATS["max_duration"], took)
+            for k in ("fetches", "changes", "errors", "not_modified", "bytes"):
+                STATS[k] += cycle[k]
+            if self.jobs.get(job.key) is job:
+                self._schedule(job, next_interval(job, datetime.now(MSK)))
+
+    # --- цикл ---
+    async def run(self) -> None:
+        STATS["started"] = now_utc()
+        self.add(Job(("site",)))
+        # известные активные даты — сразу, не дожидаясь страницы школы
+        for date in watcher.active_dates(await sched_get_all()):
+            self.add(Job(("meta", date)))
+
+        try:
+            await self._loop()
+        finally:
+            # отмена (потеря лидерства, остановка): начатые проверки не должны слать рассылку
+            # и писать в БД после того, как задачу наблюдателя сняли
+            for t in list(self._running):
+                t.cancel()
+            await asyncio.gather(*list(self._running), return_exceptions=True)
+
+    async def _loop(self) -> None:
+        while True:
+            STATS["jobs"] = len(self.jobs)
+            if not self._heap:
+                STATS["next_in"] = None
+                self._wake.clear()
+                await self._wake.wait()
+                continue
+            at, seq, key = self._heap[0]
+            delay = at - time.monotonic()
+            STATS["next_in"] = max(delay, 0.0)
+            if delay > 0:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            heapq.heappop(self._heap)
+            job = self.jobs.get(key)
+            if job is None or job.seq != seq:
+                continue
+            t = asyncio.create_task(self._run(job))
+            self._running.add(t)
+            t.add_done_callback(self._running.discard)
@@ -1,16 +1,19 @@
-import csv
 import re
-from io import StringIO
-from typing import Dict, List, Optional, Set, Tuple
-from urllib.parse import urlparse, parse_qs, urlencode, urlunparse
+from html import unescape
+from typing import Dict, Set, Tuple
+from urllib.parse import urlparse, urlencode, urlunparse
 from bs4 import BeautifulSoup
 from .http import fetch_text
 
 
+def spreadsheet_id(url: str) -> str:
+    parts = urlparse(url).path.split("/")
+    return parts[parts.index("d") + 1]
+
+
 def _rebuild(url: str, tail: str, extra: Dict[str, str]) -> str:
     u = urlparse(url)
-    parts = u.path.split("/")
-    sid = parts[parts.index("d") + 1]
+    sid = spreadsheet_id(url)
     return urlunparse((u.scheme, u.netloc, f"/spreadsheets/d/{sid}/{tail}", "", urlencode(extra), ""))
 
 
@@ -35,30 +38,82 @@ async def resolve_google_url(schedule_page_url: str) -> str:
     raise RuntimeError("Не нашли ссылку на Google Sheets.")
 
 
-async def sheets_meta(google_url: str) -> Tuple[Dict[str, str], Set[str]]:
-    html_text = await fetch_text(htmlview_url(google_url))
-    soup = BeautifulSoup(html_text, "html.parser")
+# Метаданные htmlview за один проход по странице (без DOM и без .*? по всему документу):
+# вкладки видны как ссылки <a href="…gid=N">Название</a>, как JSON {"gid"/"sheetId": N, …, "title": "…"}
+# и как просто упоминания gid (в т.ч. в экранированных URL: \u0026gid\u003dN).
+# Название из JSON берём, только если оно не дальше _TITLE_WINDOW символов от gid.
+_META_RX = re.compile(
+    r'<a\s(?P<tag>[^>]{0,2000})>(?P<text>[^<]{0,300})'
+    r'|(?:[?&;#]|\\u0026|\\u003f)gid(?:=|\\u003d)(?P<qgid>\d+)'
+    r'|data-gid="(?P<dgid>\d+)"'
+    r'|"gid"\s*:\s*"?(?P<jgid>\d+)'
+    r'|"sheetId"\s*:\s*(?P<sid>\d+)'
+    r'|gid\\":\s*"?(?P<egid>\d+)'
+    r'|"title"\s*:\s*"(?P<title>[^"]{1,300})"'
+)
+_HREF_GID_RX = re.compile(r'href="[^"]*?[?&#]gid=(\d+)')
+_ARIA_RX = re.compile(r'aria-label="([^"]*)"')
+_TAG_RX = re.compile(r"<[^>]*>")
+_TITLE_WINDOW = 2000
+
+
+def _anchor_text(html_text: str, start: int, head: str) -> str:
+    text = head
+    if html_text.startswith("<", start) and not html_text.startswith("</a", start):
+        # в ссылке вложенные теги — текст до </a>, но не дальше 500 символов
+        end = html_text.find("</a", start, start + 500)
+        if end != -1:
+            text = head + _TAG_RX.sub(" ", html_text[start:end])
+    return " ".join(unescape(text).split())
+
+
+def parse_sheets_meta(html_text: str) -> Tuple[Dict[str, str], Set[str]]:
+    """htmlview -> ({gid: название вкладки}, все gid на странице)."""
     gid2title: Dict[str, str] = {}
-    for a in soup.find_all("a", href=True):
-        if "gid=" in a["href"]:
-            gid = parse_qs(urlparse(a["href"]).query).get("gid", ["0"])[0]
-            title = (a.get("aria-label") or a.get_text(" ", strip=True) or "").strip()
+    json_titles: Dict[str, str] = {}
+    gids: Set[str] = set()
+    pending, pending_at = None, 0
+    for m in _META_RX.finditer(html_text):
+        kind = m.lastgroup
+        if kind == "text":
+            hg = _HREF_GID_RX.search(m.group("tag"))
+            if not hg:
+                continue
+            gid = hg.group(1)
+            gids.add(gid)
+            aria = _ARIA_RX.search(m.group("tag"))
+            title = " ".join(unescape(aria.group(1)).split()) if aria else ""
+            title = title or _anchor_text(html_text, m.end(), m.group("text"))
             if title:
-                gid2title[gid] = title
-    for m in re.finditer(r'"gid"\s*:\s*(\d+).*?"title"\s*:\s*"([^"]+)"', html_text, flags=re.DOTALL):
-        gid2title.setdefault(m.group(1), m.group(2))
-    for m in re.finditer(r'"sheetId"\s*:\s*(\d+).*?"title"\s*:\s*"([^"]+)"', html_text, flags=re.DOTALL):
-        gid2title.setdefault(m.group(1), m.group(2))
-    gids: Set[str] = set(
-        re.findall(r"[?&]gid=(\d+)", html_text)
-        + re.findall(r'data-gid="(\d+)"', html_text)
-        + re.findall(r'gid\\?":\s*"?(\d+)"?', html_text)
-    )
+                gid2title.setdefault(gid, title)
+        elif kind == "title":
+            if pending is not None and m.start() - pending_at <= _TITLE_WINDOW:
+                json_titles.setdefault(pending, m.group("title"))
+            pending = None
+        else:
+            gid = m.group(kind)
+            if kind != "sid":
+                gids.add(gid)
+            if kind in ("jgid", "sid"):
+                pending, pending_at = gid, m.end()
+    for gid, title in json_titles.items():
+        gid2title.setdefault(gid, title)
     if not gids:
         gids.add("0")
     return gid2title, gids
 
 
-async def get_rows_from_csv(g_url: str, gid: str) -> List[List[str]]:
-    text = await fetch_text(csv_url(g_url, gid))
-    return [list(r) for r in csv.reader(StringIO(text))]
+async def sheets_meta(google_url: str, fresh: bool = False) -> Tuple[Dict[str, str], Set[str]]:
+    """
+    Вкладки таблицы: ({gid: название}, gids). Кэш на таблицу (META_CACHE_TTL);
+    fresh=True — перечитать страницу и обновить кэш (наблюдатель ищет новые вкладки).
+    """
+    from .state import SHEET_META
+    key = spreadsheet_id(google_url)
+    if not fresh:
+        cached = SHEET_META.get(key)
+        if cached is not None:
+            return cached
+    meta = parse_sheets_meta(await fetch_text(htmlview_url(google_url)))
+    SHEET_META[key] = meta
+    return meta
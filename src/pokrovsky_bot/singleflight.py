@@ -0,0 +1,39 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Склейка одновременных вызовов: пока для ключа идёт запрос, остальные
+    вызывающие ждут его же результат, а не запускают свой.
+    """
+
+    def __init__(self) -> None:
+        self._inflight: Dict[Hashable, "asyncio.Future[Any]"] = {}
+        self.calls = 0       # реально выполненных запросов
+        self.coalesced = 0   # вызовов, присоединившихся к уже идущему
+
+    def busy(self, key: Hashable) -> bool:
+        return key in self._inflight
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        fut = self._inflight.get(key)
+        if fut is not None:
+            self.coalesced += 1
+        else:
+            self.calls += 1
+            fut = asyncio.ensure_future(fn())
+            self._inflight[key] = fut
+
+            def _done(f: "asyncio.Future[Any]", key=key) -> None:
+                if self._inflight.get(key) is f:
+                    del self._inflight[key]
+                # ошибку забирают ожидающие; если все отменились — не шумим в лог
+                if not f.cancelled():
+                    f.exception()
+
+            fut.add_done_callback(_done)
+        # shield: отмена одного вызывающего не должна отменять общий запрос
+        return await asyncio.shield(fut)
@@ -1,41 +1,118 @@
+from html.parser import HTMLParser
+from typing import Dict, List, Optional
+from urllib.parse import urljoin
+from .config import settings
+from .http import fetch_text
+from .models import SLink
+from .state import SECTION_RX, TITLE_RX, EXCLUDE_SUBSTRINGS
+from .utils import norm
+
+try:  # необязательный быстрый парсер; без него — html.parser из стандартной библиотеки
+    from lxml import etree as _lxml
+except ImportError:
+    _lxml = None
+
+# Страница школы разбирается за один проход в порядке документа: помним последний встреченный
+# заголовок «площадка №N» и берём ссылки, которые идут после заголовка площадки №1.
+_TAIL = 80  # хвост текста, в котором ищем заголовок, разбитый тегами («площадка <b>№1</b>»)
+
+
+class _LinkScanner:
+    """Цель парсера (интерфейс lxml target: start/end/data/close)."""
+
+    def __init__(self, base_url: str) -> None:
+        self.base_url = base_url
+        self.section: Optional[int] = None
+        self.tail = ""
+        self.href: Optional[str] = None
+        self.href_section: Optional[int] = None
+        self.parts: List[str] = []
+        self.out: List[SLink] = []
+
+    def start(self, tag: str, attrs: Dict[str, Optional[str]]):
+        # граница тега разделяет слова, как get_text(" ")
+        self._gap()
+        if tag == "a":
+            self.href = attrs.get("href")
+            self.href_section = self.section
+            self.parts = []
+
+    def end(self, tag: str):
+        self._gap()
+        if tag != "a" or self.href is None:
+            return
+        href, self.href = self.href, None
+        if self.href_section != 1:
+            return
+        title = norm(" ".join(self.parts))
+        if any(x in title.lower() for x in EXCLUDE_SUBSTRINGS):
+            return
+        m = TITLE_RX.search(title)
+        if m:
+            self.out.append(SLink(title=title, url=urljoin(self.base_url, href), date=m.group(1)))
+
+    def _gap(self):
+        if not self.tail.endswith(" "):
+            self.tail += " "
+
+    def data(self, text: str):
+        if self.href is not None:
+            self.parts.append(text)
+        buf = self.tail + norm(text)
+        for m in SECTION_RX.finditer(buf):
+            if m.end() > len(self.tail):  # совпадения целиком из старого хвоста уже учтены
+                self.section = int(m.group(1))
+        self.tail = buf[-_TAIL:]
+
+    def close(self) -> List[SLink]:
+        return self.out
+
+
+class _StdlibParser(HTMLParser):
+    def __init__(self, target: _LinkScanner) -> None:
+        super().__init__(convert_charrefs=True)
+        self.target = target
+
+    def handle_starttag(self, tag, attrs):
+        self.target.start(tag, dict(attrs))
+
+    def handle_endtag(self, tag):
+        self.target.end(tag)
+
+    def handle_data(self, data):
+        self.target.data(data)
+
+
+def scan_links(html_content: str, base_url: str) -> List[SLink]:
+    """Ссылки «Расписание уроков на ДД.ММ» секции площадки №1 в порядке документа."""
+    scanner = _LinkScanner(base_url)
+    if _lxml is not None:
+        parser = _lxml.HTMLParser(target=scanner)
+        parser.feed(html_content)
+        return parser.close()
+    p = _StdlibParser(scanner)
+    p.feed(html_content)
+    p.close()
+    return scanner.close()
+
+
 async def get_links_from_site() -> List[SLink]:
     PAGE_URL = settings.PAGE_URL
-    
+
     try:
         html_content = await fetch_text(PAGE_URL)
-        soup = BeautifulSoup(html_content, "html.parser")
-        
-        cur_section, out = None, []
-        
-        for el in soup.find_all(True):
-            text = norm(el.get_text(" ", strip=True))
-            m = SECTION_RX.search(text)
-            if m:
-                cur_section = int(m.group(1)) if m.group(1).isdigit() else None
-                continue
-            
-            if cur_section != 1:
-                continue
-                
-            for a in el.find_all("a", href=True):
-                title = norm(a.get_text(" ", strip=True))
-                if any(x in title.lower() for x in EXCLUDE_SUBSTRINGS):
-                    continue
-                    
-                m2 = TITLE_RX.search(title)
-                if m2:
-                    out.append(SLink(title=title, url=urljoin(PAGE_URL, a["href"]), date=m2.group(1)))
-        
+        out = scan_links(html_content, PAGE_URL)
+
         uniq = {(l.title, l.url): l for l in out}
         res = list(uniq.values())
-        
+
         def sort_key(x: SLink):
             dd, mm = x.date.split(".")
             return (int(mm), int(dd))
-        
+
         res.sort(key=sort_key, reverse=True)
         return res
-        
+
     except Exception as e:
         print(f"Ошибка при получении ссылок с сайта: {e}")
         # Возвращаем пустой список вместо падения
@@ -1,10 +1,13 @@
 import re
-from typing import Any, Dict, List, Optional, Set, Tuple
+from typing import Any, Dict, List, Optional, Set
 
 from aiogram.types import (
     InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup, KeyboardButton
 )
 
+from .cache import LRUCache
+from .config import settings
+
 SECTION_RX = re.compile(r"образовательная\s+площадка\s*№\s*(\d+)", re.IGNORECASE)
 TITLE_RX   = re.compile(r"расписан\w*\s+урок\w*\s+на\s+(\d{2}\.\d{2})", re.IGNORECASE)
 CLASS_LABEL_RX = re.compile(r"(\d{1,2})\s*([^\d\s][^\d]*)", re.UNICODE)
@@ -12,13 +15,44 @@ TIME_RX = re.compile(r"\d{1,2}[:.]\d{2}\s*[-–—]\s*\d{1,2}[:.]\d{2}")
 CLASS_PURE_RX = re.compile(r'^\s*\d{1,2}\s*[A-Za-zА-Яа-яЁё]{1,6}\s*$')
 EXCLUDE_SUBSTRINGS = {"начальная школа"}
 
+_MB = 1024 * 1024
+
 LINKS: List[Any] = []
-DOC_URL: Dict[str, str] = {}
-GID_BY_GRADE: Dict[str, Dict[int, str]] = {}
+# date -> google_url
+DOC_URL = LRUCache("doc_url", max_bytes=_MB, ttl=settings.META_CACHE_TTL)
+# id таблицы -> ({gid: название вкладки}, gids) — см. sheets.sheets_meta
+SHEET_META = LRUCache("sheet_meta", max_bytes=_MB, ttl=settings.META_CACHE_TTL)
+# date -> {grade: gid}
+GID_BY_GRADE = LRUCache("gid_by_grade", max_bytes=_MB, ttl=settings.META_CACHE_TTL)
 ALL_GIDS: Dict[str, Set[str]] = {}
-MATRIX: Dict[Tuple[str, str], Tuple[Any, Any, Any, Any]] = {}
+# (date, gid) -> (rows, labels, headers, cab_map)
+MATRIX = LRUCache("matrix", max_bytes=settings.SHEET_CACHE_MB * _MB, ttl=settings.SHEET_CACHE_TTL)
+# date -> CabIndex (вклад каждой вкладки + {cab: [(time, klass, subj), ...]}), ведёт cabinets.py.
+# Свежесть держат update_tab/invalidate (наблюдатель, follow_loop); TTL длинный — только страховка
+CAB_INDEX = LRUCache("cab_index", max_bytes=settings.CAB_CACHE_MB * _MB, ttl=settings.META_CACHE_TTL)
+# (date, gid) -> (digest, {класс: уроки}) — последняя версия листа, которую видел наблюдатель (для diff)
+SNAPSHOTS = LRUCache("snapshots", max_bytes=settings.CAB_CACHE_MB * _MB)
 STATE: Dict[int, Dict[str, Any]] = {}
 
+
+def remember_gid(date: str, grade: int, gid: str):
+    # перезаписываем целиком, чтобы кэш пересчитал размер записи
+    GID_BY_GRADE[date] = {**(GID_BY_GRADE.get(date) or {}), grade: gid}
+
+
+# --- Хуки инвалидации (зовёт наблюдатель при изменении хэша листа) ---
+def invalidate_sheet(date: str, gid: str):
+    # CAB_INDEX не трогаем: вклад вкладки обновит наблюдатель (cabinets.update_tab)
+    MATRIX.invalidate((date, gid))
+
+
+def sync_sheet_digest(date: str, gid: str, digest: str):
+    """Сбрасывает лист из кэша, если там другая версия (по sha256 CSV), чем сейчас в таблице."""
+    cached = MATRIX.peek((date, gid))
+    if cached is not None and getattr(cached, "digest", digest) != digest:
+        invalidate_sheet(date, gid)
+
+
 MAIN_KB = ReplyKeyboardMarkup(
     keyboard=[
         [KeyboardButton(text="📅 Посмотреть расписание")],
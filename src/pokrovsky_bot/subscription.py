@@ -4,14 +4,64 @@ from aiogram import BaseMiddleware, Bot
 from aiogram.exceptions import TelegramBadRequest
 from aiogram.types import (
     CallbackQuery,
+    ChatMemberUpdated,
     InlineKeyboardButton,
     InlineKeyboardMarkup,
     Message,
     TelegramObject,
 )
 
+from .cache import LRUCache
+from .config import settings
+from .singleflight import SingleFlight
+
 ALLOWED_STATUSES = {"creator", "administrator", "member"}
 
+# user_id -> подписан ли. Подписку кэшируем надолго, отсутствие — ненадолго (человек как раз подписывается).
+# Сбрасывается кнопкой «Проверить подписку» и обновлениями chat_member (если бот — админ канала).
+MEMBERSHIP = LRUCache("subscription", max_bytes=2 * 1024 * 1024)
+FLIGHT = SingleFlight()
+
+
+def remember_subscription(user_id: int, ok: bool) -> None:
+    MEMBERSHIP.set(user_id, ok, ttl=settings.SUB_CACHE_TTL if ok else settings.SUB_NEG_TTL)
+
+
+async def check_subscription(bot: Bot, channel_id: str, user_id: int, force: bool = False) -> bool:
+    """Подписан ли пользователь на канал; force — мимо кэша (кнопка «Проверить подписку»)."""
+    if not force:
+        cached = MEMBERSHIP.get(user_id)
+        if cached is not None:
+            return cached
+
+    async def load() -> bool:
+        try:
+            member = await bot.get_chat_member(chat_id=channel_id, user_id=user_id)
+            ok = getattr(member, "status", None) in ALLOWED_STATUSES
+        except TelegramBadRequest:
+            ok = False
+        remember_subscription(user_id, ok)
+        return ok
+
+    return await FLIGHT.do(("sub", user_id, force), load)
+
+
+def _is_channel(chat: Any, channel_id: str) -> bool:
+    cid = (channel_id or "").strip()
+    if not cid:
+        return False
+    if cid.startswith("@"):
+        return bool(chat.username) and f"@{chat.username}".lower() == cid.lower()
+    return str(chat.id) == cid
+
+
+async def on_channel_member(ev: ChatMemberUpdated) -> None:
+    """Обновление chat_member из канала: сразу знаем новый статус, без запроса к API."""
+    if not _is_channel(ev.chat, settings.NEWS_CHANNEL_ID):
+        return
+    member = ev.new_chat_member
+    remember_subscription(member.user.id, getattr(member, "status", None) in ALLOWED_STATUSES)
+
 
 def make_sub_keyboard(url: str) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(
@@ -30,11 +80,7 @@ class SubscriptionMiddleware(BaseMiddleware):
         self.admin_id = admin_id
 
     async def _is_subscribed(self, bot: Bot, user_id: int) -> bool:
-        try:
-            member = await bot.get_chat_member(chat_id=self.channel_id, user_id=user_id)
-            return getattr(member, "status", None) in ALLOWED_STATUSES
-        except TelegramBadRequest:
-            return False
+        return await check_subscription(bot, self.channel_id, user_id)
 
     async def __call__(
         self,
@@ -1,6 +1,6 @@
 import html
 import re
-from datetime import datetime, timezone
+from datetime import date, datetime, timezone
 from typing import Optional
 
 from .config import MSK
@@ -45,5 +45,21 @@ def fmt_msk(iso: Optional[str]) -> str:
         return str(iso)
 
 
+def date_from_label(label: str, today: Optional[date] = None) -> Optional[date]:
+    """'08.09' -> date; год выбираем ближайший к today (расписания на стыке декабря/января)."""
+    m = re.match(r"^\s*(\d{1,2})\.(\d{1,2})", label or "")
+    if not m:
+        return None
+    dd, mm = int(m.group(1)), int(m.group(2))
+    today = today or datetime.now(MSK).date()
+    cands = []
+    for y in (today.year - 1, today.year, today.year + 1):
+        try:
+            cands.append(date(y, mm, dd))
+        except ValueError:
+            continue
+    return min(cands, key=lambda d: abs((d - today).days)) if cands else None
+
+
 def bold(s: str) -> str:
     return f"<b>{html.escape(s)}</b>"
@@ -1,15 +1,19 @@
 import hashlib
-import random
 import asyncio
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
 from aiogram import Bot
 
-from .db import sched_get_all, sched_upsert, hash_get, hash_set
-from .sheets import resolve_google_url, sheets_meta, csv_url
+from .config import MSK, settings
+from .db import sched_get_all, sched_upsert, hash_get, hash_set, hashes_since, now_utc, validators_get, validators_set
+from .sheets import resolve_google_url, sheets_meta, csv_url, spreadsheet_id
 from .site import get_links_from_site
-from .http import fetch_text
-from .utils import fmt_msk
-from . import state
-from .notify import notify_new_schedule, notify_schedule_changes
+from .links import push_links
+from .http import fetch_conditional
+from .utils import fmt_msk, date_from_label
+from . import state, cabinets
+from .notify import notify_new_schedule, notify_class_changes
+from .diff import diff_sheet
 
 
 async def broadcast(bot: Bot, text: str):
@@ -17,8 +21,8 @@ async def broadcast(bot: Bot, text: str):
     Оставил утилиту на всякий случай (не используется для расписаний).
     Рассылает сообщение всем пользователям из таблицы users.
     """
-    from .db import DB
-    users = [row[0] for row in DB.execute("SELECT user_id FROM users").fetchall()]
+    from .db import user_ids_all
+    users = await user_ids_all()
     sem = asyncio.Semaphore(20)
 
     async def send(uid):
@@ -31,73 +35,210 @@ async def broadcast(bot: Bot, text: str):
     await asyncio.gather(*(send(uid) for uid in users))
 
 
-async def check_once(bot: Bot):
+def active_dates(known: Dict[str, Tuple[str, Optional[str]]]) -> Dict[str, Tuple[str, Optional[str]]]:
+    """Окно дат для сканирования: [сегодня − WATCH_PAST_DAYS; сегодня + WATCH_FUTURE_DAYS]."""
+    today = datetime.now(MSK).date()
+    lo = today - timedelta(days=settings.WATCH_PAST_DAYS)
+    hi = today + timedelta(days=settings.WATCH_FUTURE_DAYS)
+    out = {}
+    for date, v in known.items():
+        d = date_from_label(date, today)
+        if d is None or lo <= d <= hi:
+            out[date] = v
+    return out
+
+
+def _previous_lessons(date: str, gid: str, digest: Optional[str]) -> Optional[Dict[str, List[tuple]]]:
+    """Уроки прежней версии листа (снимок наблюдателя или загруженный пользователями лист)."""
+    snap = state.SNAPSHOTS.peek((date, gid))
+    if snap is not None and snap[0] == digest:
+        return snap[1]
+    sheet = state.MATRIX.peek((date, gid))
+    if sheet is not None and sheet.digest == digest:
+        return sheet.lessons
+    return None
+
+
+def _remember(date: str, gid: str, body: bytes, digest: str, with_html: bool = False):
+    """Разбирает версию листа и запоминает её уроки как снимок; -> SheetData (HTML — только по with_html)."""
+    from .ensure import build_sheet
+    sheet = build_sheet(date, body.decode("utf-8", errors="replace"), with_html)
+    state.SNAPSHOTS[(date, gid)] = (digest, sheet.lessons)
+    return sheet
+
+
+async def check_gid(date: str, g_url: str, gid: str, title: str, sem: asyncio.Semaphore, cycle: Dict[str, int]) -> str:
+    """Проверка одного листа. -> "changed" | "same" | "not_modified" | "error"."""
+    url = csv_url(g_url, gid)
+    v = await validators_get(url) or {}
+    async with sem:
+        try:
+            status, body, hdrs = await fetch_conditional(url, v.get("etag"), v.get("last_modified"))
+        except Exception:
+            cycle["errors"] += 1
+            return "error"
+    cycle["fetches"] += 1
+    if status == 304:
+        # сервер подтвердил: не менялось — ни тела, ни хэширования
+        cycle["not_modified"] += 1
+        return "not_modified"
+    cycle["bytes"] += len(body)
+
+    # Google-выгрузка валидаторы часто игнорирует: тогда сравниваем sha256 сырых байт
+    # (совпадает с прежним sha256(text.encode()) для UTF-8, поэтому старые хэши в БД валидны)
+    h = hashlib.sha256(body).hexdigest()
+    if h == v.get("digest"):
+        # то же тело, что при прошлом опросе: версия в sheet_hashes та же, БД не трогаем,
+        # разве что сервер сменил валидаторы
+        if (hdrs["etag"], hdrs["last_modified"]) != (v.get("etag"), v.get("last_modified")):
+            await validators_set(url, hdrs["etag"], hdrs["last_modified"], hdrs["length"], h)
+        old = h
+    else:
+        await validators_set(url, hdrs["etag"], hdrs["last_modified"], hdrs["length"], h)
+        old = await hash_get(date, gid)
+    # прежняя версия нужна для поурочного diff — забираем до сброса кэша листа
+    prev = _previous_lessons(date, gid, old) if old != h else None
+    state.sync_sheet_digest(date, gid, h)
+
+    if old is None or old == h:
+        if old is None:
+            await hash_set(date, gid, title, h)
+        if state.SNAPSHOTS.peek((date, gid)) is None or cabinets.is_stale(date, gid, h):
+            try:
+                cabinets.update_tab(date, gid, _remember(date, gid, body, h))
+            except Exception:
+                state.CAB_INDEX.invalidate(date)
+        return "same"
+
+    # зафиксировали изменение
+    await hash_set(date, gid, title, h)
+    cycle["changes"] += 1
+    tnow = fmt_msk(now_utc())
+    title = title or f"лист {gid}"
+    diff_text = f"Изменения в листе «{title}»\n{tnow}"
+
+    changes, labels = {}, None
     try:
-        links = await get_links_from_site()
+        # один разбор на всё: снимок, MATRIX (с HTML) и индекс кабинетов
+        sheet = _remember(date, gid, body, h, with_html=True)
+        state.MATRIX[(date, gid)] = sheet
+        cabinets.update_tab(date, gid, sheet)
+        labels = list(sheet.labels)
+        if prev is not None:
+            changes = diff_sheet(prev, sheet.lessons)
+            if not changes:
+                # поменялось что-то вне уроков (заголовки, оформление) — не беспокоим
+                return "changed"
+    except Exception as e:
+        state.CAB_INDEX.invalidate(date)
+        print(f"[watcher] diff {date}/{gid}: {e}")
+
+    # Отправляем только тем, кто включил уведомления об изменениях
+    try:
+        await notify_class_changes(date, changes, diff_text, labels)
     except Exception:
-        return
+        pass
+    return "changed"
+
+
+async def date_meta(
+    date: str, link_url: str, g_url: Optional[str], sem: asyncio.Semaphore, cycle: Dict[str, int]
+) -> Optional[Tuple[str, Dict[str, str], List[str]]]:
+    """Google-URL и список вкладок даты -> (g_url, gid2title, gids) или None при ошибке."""
+    async with sem:
+        if not g_url:
+            try:
+                g_url = await resolve_google_url(link_url)
+                await sched_upsert(date, link_url, g_url)
+            except Exception:
+                cycle["errors"] += 1
+                return None
+        try:
+            gid2title, gids = await sheets_meta(g_url, fresh=True)
+        except Exception:
+            cycle["errors"] += 1
+            return None
+    cycle["fetches"] += 1
+    return g_url, gid2title, list(gid2title.keys() or gids)
 
-    known = sched_get_all()
 
-    # 1) Новые даты расписаний
+async def discover_dates() -> bool:
+    """Страница с датами: обновить кэш ссылок, зарегистрировать и разослать новые даты."""
+    try:
+        links = await get_links_from_site()
+    except Exception:
+        return False
+    if not links:
+        return False
+    # свежие даты сразу в кэш ссылок — пользователи увидят их без ожидания конца цикла
+    push_links(links)
+
+    known = await sched_get_all()
     for l in links:
         if l.date not in known:
             try:
                 g_url = await resolve_google_url(l.url)
             except Exception:
                 g_url = None
-            sched_upsert(l.date, l.url, g_url)
+            await sched_upsert(l.date, l.url, g_url)
             state.DOC_URL[l.date] = g_url or state.DOC_URL.get(l.date)
 
             # Точечная рассылка нового расписания по выбранным пользователем классам
             try:
-                await notify_new_schedule(bot, l.date)
+                await notify_new_schedule(l.date)
             except Exception:
                 pass
+    return True
 
-    # 2) Проверка изменений по уже известным датам (хэши листов)
-    for date, (link_url, g_url) in sched_get_all().items():
-        if not g_url:
-            try:
-                g_url = await resolve_google_url(link_url)
-                sched_upsert(date, link_url, g_url)
-            except Exception:
-                continue
-        try:
-            gid2title, gids = await sheets_meta(g_url)
-        except Exception:
-            continue
 
-        for gid in (gid2title.keys() or gids):
-            try:
-                csv_text = await fetch_text(csv_url(g_url, gid))
-            except Exception:
-                continue
-
-            h = hashlib.sha256(csv_text.encode("utf-8")).hexdigest()
-            old = hash_get(date, gid)
-            if old is None:
-                hash_set(date, gid, gid2title.get(gid, ""), h)
-            elif old != h:
-                # зафиксировали изменение
-                hash_set(date, gid, gid2title.get(gid, ""), h)
-                tnow = fmt_msk(None)
-                title = gid2title.get(gid, f"лист {gid}")
-                diff_text = f"Изменения в листе «{title}»\n{tnow}"
-
-                # Отправляем только тем, кто включил уведомления об изменениях
-                try:
-                    await notify_schedule_changes(bot, date, diff_text)
-                except Exception:
-                    pass
-
-    # 3) Обновляем кеш ссылок в state
-    state.LINKS.clear()
-    state.LINKS.extend(links or [])
-
-
-async def watch_loop(bot: Bot):
-    await check_once(bot)
+def new_cycle() -> Dict[str, int]:
+    return {"fetches": 0, "errors": 0, "changes": 0, "not_modified": 0, "bytes": 0}
+
+
+async def follow_loop(is_leader: Callable[[], bool]):
+    """
+    Реплика не лидер: наблюдатель работает у лидера, а кэши листов и кабинетов у каждой реплики свои.
+    Версии, которые лидер пишет в sheet_hashes, сверяем с кэшем и сбрасываем устаревшее:
+    листы и индекс кабинетов — по digest, ссылку на таблицу — по schedules, состав вкладок —
+    если появился gid, которого нет в закэшированных метаданных. Удалённые вкладки так не видны:
+    их метаданные доживают до META_CACHE_TTL (лист по такому gid просто не загрузится).
+    """
+    period = max(settings.LEADER_LEASE_TTL, 3.0) / 3
+    since = ""
     while True:
-        await asyncio.sleep(random.randint(300, 600))
-        await check_once(bot)
+        await asyncio.sleep(period)
+        if is_leader():
+            # у лидера кэш обновляет сам наблюдатель
+            continue
+        try:
+            since = await _follow_once(since)
+        except Exception as e:
+            print(f"[follow] {e!r}")
+
+
+async def _follow_once(since: str) -> str:
+    rows = await hashes_since(since)
+    known = await sched_get_all()
+    for date, (_link_url, g_url) in known.items():
+        cached = state.DOC_URL.peek(date)
+        if g_url and cached is not None and cached != g_url:
+            state.DOC_URL[date] = g_url
+            state.GID_BY_GRADE.invalidate(date)
+    for date, gid, h, ts in rows:
+        state.sync_sheet_digest(date, gid, h)
+        if cabinets.is_stale(date, gid, h):
+            state.CAB_INDEX.invalidate(date)
+        g_url = known.get(date, (None, None))[1]
+        meta = state.SHEET_META.peek(spreadsheet_id(g_url)) if g_url else None
+        if meta is not None and gid not in meta[0] and gid not in meta[1]:
+            # у лидера новая вкладка — перечитаем состав таблицы при следующем запросе
+            state.SHEET_META.invalidate(spreadsheet_id(g_url))
+            state.GID_BY_GRADE.invalidate(date)
+        since = max(since, ts)
+    return since
+
+
+async def watch_loop():
+    """Адаптивный опрос: у каждого листа своё время следующей проверки (см. scheduler.py)."""
+    from .scheduler import PollScheduler
+    await PollScheduler().run()
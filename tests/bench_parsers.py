@@ -0,0 +1,62 @@
+"""
+Замер однопроходных парсеров против прежних (tests/legacy.py) на фикстурах, раздутых до
+размера настоящих страниц:  python tests/bench_parsers.py
+"""
+import sys
+import time
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+sys.path[:0] = [str(HERE), str(HERE.parent / "src")]
+
+import legacy  # noqa: E402
+from pokrovsky_bot.sheets import parse_sheets_meta  # noqa: E402
+from pokrovsky_bot.site import scan_links  # noqa: E402
+
+FIXTURES = HERE / "fixtures"
+
+
+def best(fn, *args, repeat: int = 3) -> float:
+    out = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(*args)
+        out.append(time.perf_counter() - t0)
+    return min(out)
+
+
+def compare(label: str, old, new, *args):
+    assert old(*args) == new(*args), f"{label}: результаты разошлись"
+    t_old, t_new = best(old, *args), best(new, *args)
+    print(f"{label:<40} {len(args[0]) / 1e3:7.0f} КБ  было {t_old * 1000:8.1f} мс  стало {t_new * 1000:7.1f} мс")
+
+
+def inflate_htmlview(html_text: str, times: int) -> str:
+    # копии строк таблицы: страница растёт, как у листа на сотни строк
+    head, rest = html_text.split("<tbody>", 1)
+    body, tail = rest.split("</tbody>", 1)
+    return f"{head}<tbody>{body * times}</tbody>{tail}"
+
+
+def main():
+    page = (FIXTURES / "htmlview_20_10.html").read_text(encoding="utf-8")
+    for times in (1, 16, 160):
+        compare(f"parse_sheets_meta x{times}", legacy.parse_sheets_meta, parse_sheets_meta, inflate_htmlview(page, times))
+    # sheetId без title: прежний .*? для каждого id просматривал документ до конца
+    bad = '"sheetId": 1, ' * 2000 + "x" * 200000
+    compare("parse_sheets_meta sheetId без title", legacy.parse_sheets_meta, parse_sheets_meta, bad)
+
+    # страница школы: те же секции во вложенных обёртках, как в шаблоне сайта
+    site = (FIXTURES / "schedule_page.html").read_text(encoding="utf-8")
+    url = "https://pokrovsky.gosuslugi.ru/glavnoe/raspisanie/"
+    for depth in (0, 10, 20):
+        html_text = site.replace('<div class="gw-accordion">', '<div class="w">' * depth + '<div class="gw-accordion">')
+        html_text = html_text.replace("</footer>", "</footer>" + "</div>" * depth)
+        compare(f"scan_links, вложенность +{depth}",
+                lambda h, u: legacy.site_result(legacy.scan_links(h, u)),
+                lambda h, u: legacy.site_result(scan_links(h, u)),
+                html_text, url)
+
+
+if __name__ == "__main__":
+    main()
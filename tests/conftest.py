@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# тесты запускаются без установки пакета: python -m pytest из корня проекта
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
@@ -0,0 +1,64 @@
+"""
+Прежние (до однопроходных парсеров) разборы htmlview и страницы школы — эталон для тестов
+равенства и для bench_parsers.py. Код перенесён без изменений логики.
+"""
+import re
+from typing import Dict, List, Set, Tuple
+from urllib.parse import parse_qs, urljoin, urlparse
+
+from bs4 import BeautifulSoup
+
+from pokrovsky_bot.models import SLink
+from pokrovsky_bot.state import EXCLUDE_SUBSTRINGS, SECTION_RX, TITLE_RX
+from pokrovsky_bot.utils import norm
+
+
+def parse_sheets_meta(html_text: str) -> Tuple[Dict[str, str], Set[str]]:
+    soup = BeautifulSoup(html_text, "html.parser")
+    gid2title: Dict[str, str] = {}
+    for a in soup.find_all("a", href=True):
+        if "gid=" in a["href"]:
+            gid = parse_qs(urlparse(a["href"]).query).get("gid", ["0"])[0]
+            title = (a.get("aria-label") or a.get_text(" ", strip=True) or "").strip()
+            if title:
+                gid2title[gid] = title
+    for m in re.finditer(r'"gid"\s*:\s*(\d+).*?"title"\s*:\s*"([^"]+)"', html_text, flags=re.DOTALL):
+        gid2title.setdefault(m.group(1), m.group(2))
+    for m in re.finditer(r'"sheetId"\s*:\s*(\d+).*?"title"\s*:\s*"([^"]+)"', html_text, flags=re.DOTALL):
+        gid2title.setdefault(m.group(1), m.group(2))
+    gids: Set[str] = set(
+        re.findall(r"[?&]gid=(\d+)", html_text)
+        + re.findall(r'data-gid="(\d+)"', html_text)
+        + re.findall(r'gid\\?":\s*"?(\d+)"?', html_text)
+    )
+    if not gids:
+        gids.add("0")
+    return gid2title, gids
+
+
+def scan_links(html_content: str, base_url: str) -> List[SLink]:
+    soup = BeautifulSoup(html_content, "html.parser")
+    cur_section, out = None, []
+    for el in soup.find_all(True):
+        text = norm(el.get_text(" ", strip=True))
+        m = SECTION_RX.search(text)
+        if m:
+            cur_section = int(m.group(1)) if m.group(1).isdigit() else None
+            continue
+        if cur_section != 1:
+            continue
+        for a in el.find_all("a", href=True):
+            title = norm(a.get_text(" ", strip=True))
+            if any(x in title.lower() for x in EXCLUDE_SUBSTRINGS):
+                continue
+            m2 = TITLE_RX.search(title)
+            if m2:
+                out.append(SLink(title=title, url=urljoin(base_url, a["href"]), date=m2.group(1)))
+    return out
+
+
+def site_result(links: List[SLink]) -> List[SLink]:
+    """Как get_links_from_site: без повторов, новые даты первыми."""
+    res = list({(l.title, l.url): l for l in links}.values())
+    res.sort(key=lambda x: (int(x.date.split(".")[1]), int(x.date.split(".")[0])), reverse=True)
+    return res
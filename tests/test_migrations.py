@@ -0,0 +1,90 @@
+import sqlite3
+
+import pytest
+
+from pokrovsky_bot import migrations
+from pokrovsky_bot.migrations import MIGRATIONS, migrate, schema_version
+
+# Схема до появления schema_version (как её создавал старый ensure_db)
+OLD_SCHEMA = """
+CREATE TABLE users(
+  user_id INTEGER PRIMARY KEY, first_name TEXT, username TEXT,
+  joined_at TEXT, last_seen TEXT, msg_count INTEGER DEFAULT 0);
+CREATE TABLE events(
+  id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL,
+  ts TEXT NOT NULL, type TEXT NOT NULL, meta TEXT,
+  FOREIGN KEY(user_id) REFERENCES users(user_id));
+CREATE TABLE schedules(
+  date_label TEXT PRIMARY KEY, link_url TEXT NOT NULL, google_url TEXT, created_at TEXT NOT NULL);
+CREATE TABLE sheet_hashes(
+  date_label TEXT NOT NULL, gid TEXT NOT NULL, title TEXT, hash TEXT NOT NULL,
+  updated_at TEXT NOT NULL, PRIMARY KEY(date_label, gid));
+CREATE TABLE user_prefs(
+  user_id INTEGER PRIMARY KEY, notify_new INTEGER NOT NULL DEFAULT 1,
+  notify_change INTEGER NOT NULL DEFAULT 1, klass TEXT,
+  updated_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%S', 'now')));
+"""
+LATEST = MIGRATIONS[-1][0]
+
+
+@pytest.fixture
+def old_db(tmp_path):
+    path = tmp_path / "bot.db"
+    con = sqlite3.connect(path)
+    con.executescript(OLD_SCHEMA)
+    con.executemany(
+        "INSERT INTO users(user_id, first_name, username, joined_at, last_seen, msg_count) VALUES (?,?,?,?,?,?)",
+        [(1, "Аня", "anya", "2024-09-01T08:00:00+00:00", "2024-09-02T08:00:00+00:00", 3),
+         (2, "Борис", "", "2024-09-01T09:00:00+00:00", "2024-09-01T09:00:00+00:00", 1)],
+    )
+    con.executemany(
+        "INSERT INTO events(user_id, ts, type, meta) VALUES (?,?,?,?)",
+        [(1, "2024-09-01T08:00:00+00:00", "start", ""),
+         (1, "2024-09-02T08:00:00+00:00", "pick_date", "02.09"),
+         (2, "2024-09-01T09:00:00+00:00", "start", ""),
+         (2, "2024-09-01T09:05:00+00:00", "notify_change", "")],
+    )
+    con.execute("INSERT INTO user_prefs(user_id, notify_new, notify_change, klass) VALUES (1, 0, 1, '7А')")
+    con.execute("INSERT INTO sheet_hashes VALUES ('02.09', '0', '5-7', 'abc', '2024-09-02T08:00:00')")
+    con.commit()
+    yield path, con
+    con.close()
+
+
+def test_migrate_old_schema_keeps_data(old_db):
+    _path, con = old_db
+    applied = migrate(con)
+
+    assert applied == [v for v, _n, _s in MIGRATIONS]
+    assert schema_version(con) == LATEST
+    assert con.execute("SELECT user_id, first_name, msg_count FROM users ORDER BY user_id").fetchall() == [
+        (1, "Аня", 3), (2, "Борис", 1)]
+    assert con.execute("SELECT COUNT(*) FROM events").fetchone()[0] == 4
+    assert con.execute("SELECT notify_new, notify_change, klass FROM user_prefs").fetchone() == (0, 1, "7А")
+    assert con.execute("SELECT hash FROM sheet_hashes WHERE date_label='02.09'").fetchone() == ("abc",)
+    # сводки досчитаны по истории; уведомления не считаются активностью
+    totals = dict(con.execute("SELECT key, value FROM stats_totals"))
+    assert totals == {"users": 2, "events": 4}
+    assert con.execute("SELECT day, events, users FROM stats_daily ORDER BY day").fetchall() == [
+        ("2024-09-01", 3, 2), ("2024-09-02", 1, 1)]
+
+    # повторный запуск ничего не делает
+    assert migrate(con) == []
+    assert schema_version(con) == LATEST
+
+
+def test_concurrent_migrate_skips_applied_versions(old_db, monkeypatch):
+    path, con = old_db
+    other = sqlite3.connect(path)
+    try:
+        migrate(other)
+    finally:
+        other.close()
+
+    # второй процесс прочитал версию до того, как первый всё применил
+    monkeypatch.setattr(migrations, "schema_version", lambda _con: 0)
+    assert migrate(con) == []
+
+    rows = con.execute("SELECT version FROM schema_version ORDER BY version").fetchall()
+    assert [r[0] for r in rows] == [v for v, _n, _s in MIGRATIONS]
+    assert dict(con.execute("SELECT key, value FROM stats_totals")) == {"users": 2, "events": 4}
@@ -0,0 +1,38 @@
+from pathlib import Path
+
+from pokrovsky_bot.sheets import parse_sheets_meta
+
+import legacy
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+
+def _read(name: str) -> str:
+    return (FIXTURES / name).read_text(encoding="utf-8")
+
+
+def test_htmlview_same_as_legacy_parser():
+    html_text = _read("htmlview_20_10.html")
+    gid2title, gids = parse_sheets_meta(html_text)
+    assert (gid2title, gids) == legacy.parse_sheets_meta(html_text)
+    assert gid2title["0"] == "5 классы"
+    assert gid2title["777301560"] == "11 классы"
+    assert len(gid2title) == 7 and set(gid2title) == gids
+
+
+def test_htmlview_edge_cases():
+    gid2title, gids = parse_sheets_meta(_read("htmlview_edge.html"))
+    old_titles, old_gids = legacy.parse_sheets_meta(_read("htmlview_edge.html"))
+    assert gid2title == {
+        "55": "9 классы",        # #gid= во фрагменте; прежний разбор относил вкладку к gid 0
+        "66": "7 А, 7 Б",        # первая ссылка на вкладку, а не «Открыть в Таблицах» из подвала
+        "88": "10 классы",       # пробелы в aria-label схлопнуты
+        "314": "Кабинеты",
+        "272": "Архив",          # название рядом с gid; прежний .*? отдавал его sheetId 271 без названия
+    }
+    assert gids == old_gids | {"77"}  # плюс gid из экранированного URL (&gid=77)
+    assert old_titles["0"] == "9 классы" and "55" not in old_titles
+
+
+def test_no_gids_defaults_to_first_tab():
+    assert parse_sheets_meta("<html><body>пусто</body></html>") == ({}, {"0"})
@@ -0,0 +1,43 @@
+from pathlib import Path
+
+import pytest
+
+from pokrovsky_bot import site
+from pokrovsky_bot.site import scan_links
+
+import legacy
+
+FIXTURES = Path(__file__).parent / "fixtures"
+URL = "https://pokrovsky.gosuslugi.ru/glavnoe/raspisanie/"
+
+
+@pytest.fixture(params=["html.parser", "lxml"])
+def parser(request, monkeypatch):
+    if request.param == "html.parser":
+        monkeypatch.setattr(site, "_lxml", None)
+    elif site._lxml is None:
+        pytest.skip("lxml не установлен")
+    return request.param
+
+
+def _page() -> str:
+    return (FIXTURES / "schedule_page.html").read_text(encoding="utf-8")
+
+
+def test_same_as_legacy_scan(parser):
+    html_text = _page()
+    new = legacy.site_result(scan_links(html_text, URL))
+    assert new == legacy.site_result(legacy.scan_links(html_text, URL))
+    assert [l.date for l in new] == ["20.10", "17.10", "16.10", "15.10"]
+    assert new[0].url.startswith("https://docs.google.com/spreadsheets/d/1AbC")
+    assert new[2].url == "https://pokrovsky.gosuslugi.ru/netcat_files/raspisanie/16.10.html"
+
+
+def test_links_before_first_section_are_ignored(parser):
+    # прежний обход относил к площадке №1 всё до её заголовка: <html> целиком содержит заголовок
+    html_text = _page().replace(
+        '<div class="gw-accordion">',
+        '<p><a href="/glavnoe/raspisanie/arhiv/">Расписание уроков на 01.09 (архив)</a></p><div class="gw-accordion">',
+    )
+    assert "01.09" not in {l.date for l in scan_links(html_text, URL)}
+    assert "01.09" in {l.date for l in legacy.scan_links(html_text, URL)}
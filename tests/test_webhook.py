@@ -0,0 +1,98 @@
+import asyncio
+import dataclasses
+import importlib
+
+import pytest
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import GetMe, SetWebhook
+from aiogram.types import Message, User
+from aiohttp.test_utils import TestClient, TestServer
+
+M = importlib.import_module("pokrovsky_bot.main")
+
+SECRET = "s3cr3t"
+UPDATE = {
+    "update_id": 1,
+    "message": {
+        "message_id": 1, "date": 0, "text": "/start",
+        "chat": {"id": 5, "type": "private"},
+        "from": {"id": 5, "is_bot": False, "first_name": "x"},
+    },
+}
+
+
+class FakeSession(BaseSession):
+    """Вместо Telegram API: запоминает вызванные методы."""
+
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+
+    async def make_request(self, bot, method, timeout=None):
+        self.calls.append(method)
+        if isinstance(method, GetMe):
+            return User(id=1, is_bot=True, first_name="bot")
+        return True
+
+    async def stream_content(self, *args, **kwargs):
+        yield b""
+
+    async def close(self):
+        pass
+
+
+@pytest.fixture
+def webhook_settings(monkeypatch):
+    def use(secret):
+        monkeypatch.setattr(M, "settings", dataclasses.replace(
+            M.settings, RUN_MODE="webhook", WEBHOOK_URL="https://bot.example.org/", WEBHOOK_SECRET=secret,
+        ))
+    # фоновые задачи (лидерство, наблюдатель) здесь не нужны
+    monkeypatch.setattr(M, "start_background", lambda bot: None)
+
+    async def stop_background():
+        pass
+    monkeypatch.setattr(M, "stop_background", stop_background)
+    return use
+
+
+def test_webhook_requires_secret(webhook_settings):
+    webhook_settings("")
+    bot = Bot("123:abc", session=FakeSession())
+    with pytest.raises(SystemExit):
+        M.build_webhook_app(bot, Dispatcher())
+
+
+def test_webhook_checks_secret_and_registers_it(webhook_settings):
+    webhook_settings(SECRET)
+    session = FakeSession()
+    bot = Bot("123:abc", session=session)
+    dp = Dispatcher()
+    seen = []
+
+    @dp.message()
+    async def on_message(m: Message):
+        seen.append(m.text)
+
+    async def run():
+        app = M.build_webhook_app(bot, dp)
+        async with TestClient(TestServer(app)) as client:
+            r = await client.post("/tg/webhook", json=UPDATE)
+            assert r.status == 401
+            r = await client.post("/tg/webhook", json=UPDATE, headers={"X-Telegram-Bot-Api-Secret-Token": "wrong"})
+            assert r.status == 401
+            r = await client.post("/tg/webhook", json=UPDATE, headers={"X-Telegram-Bot-Api-Secret-Token": SECRET})
+            assert r.status == 200
+            for _ in range(50):  # апдейт обрабатывается в фоне
+                if seen:
+                    break
+                await asyncio.sleep(0.01)
+
+    asyncio.run(run())
+
+    assert seen == ["/start"]
+    hooks = [c for c in session.calls if isinstance(c, SetWebhook)]
+    assert len(hooks) == 1
+    assert hooks[0].url == "https://bot.example.org/tg/webhook"
+    assert hooks[0].secret_token == SECRET